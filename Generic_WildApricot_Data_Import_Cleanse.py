@@ -2,20 +2,31 @@
 # Author: cwilliams
 # Date: 2025/10/14
 # Purpose: Clean event contact data before using the Import functionality into Wild Apricot CMS contacts table
-# Dependencies: argparse, datetime, glob, logging, openpyxl, pandas, xlrd, os, re, sys
+# Dependencies: argparse, datetime, glob, json, logging, numpy, openpyxl, pandas, xlrd, os, re, sys, WaApi (for --push)
 # Usage: python Generic_WildApricot_Data_Import_Cleanse.py "C:\Users\Charl\OneDrive\Documents\Development\Python\DBG\Bulb Sale 2024 ccw.xlsx" --event-column BulbSale2024 --event-value Yes --use-last-cleaned 
+#        python Generic_WildApricot_Data_Import_Cleanse.py --event-id 4321567 --event-column "DurangoScape 2025" --api-key YOUR_API_KEY
 # Date/Name/Change
 # 10/14/2025 cwilliams - Refactored to be generic with parameterized input via Claude
 # 10/28/2025 cwilliams - Modified description slightly and added usage section to document how to call the code, add a -help next?
+# 10/18/2026 - Vectorized phone parser: +1, dots, extensions, keypad letters, trailing labels and NANP area/exchange checks
+# 10/18/2026 - Added --push mode: create/update cleaned contacts through the Wild Apricot API with a resumable checkpoint
+# 10/18/2026 - Added --metrics-file to dump API metrics of the push (JSON, or Prometheus text for .prom)
+# 10/18/2026 - Added --record/--replay to capture push API traffic to a cassette and rerun it offline
+# 10/18/2026 - Added --event-id: read an event's registrants straight from the API instead of an Excel export
 
 from datetime import datetime
 import os
 import sys
 import pandas as pd
+import numpy as np
 import re
 import glob
 import logging
 import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import WaApi
 
 def setup_logging(log_filepath):
     logging.basicConfig(
@@ -95,11 +106,72 @@ def format_phone_number(clean_phone):
         return f"{clean_phone[:3]}-{clean_phone[3:6]}-{clean_phone[6:]}"
     return clean_phone
 
+# Optional +1 country code, area code with or without parentheses, exchange and line
+# separated by spaces, dashes or dots, an optional extension and an optional trailing
+# label such as "cell" or "(home)". Exchange and line may use keypad letters (555-PLNT).
+PHONE_PATTERN = (
+    r'(?i)^(?:\+?1[\s.\-]*)?'
+    r'\(?(?P<area>\d{3})\)?[\s.\-]*'
+    r'(?P<exchange>[0-9A-Za-z]{3})[\s.\-]*'
+    r'(?P<line>[0-9A-Za-z]{4})'
+    r'(?:\s*[,;]?\s*(?:x|ext\.?|extension|#)\s*(?P<extension>\d{1,6}))?'
+    r'(?:[\s,;/\-]*\(?(?P<label>[A-Za-z][A-Za-z .]*?)\)?)?$'
+)
+
+PHONE_KEYPAD = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', '22233344455566677778889999')
+
+def build_nanp_code_table():
+    """
+    Build the bundled NANP lookup table: a 1000 entry boolean array indexed by the
+    three digit code. Area codes must be NXX (N = 2-9), not an N11 service code, not
+    an N9X expansion code and not in the reserved 37X/96X blocks. Exchange codes must
+    be NXX and not an N11 service code.
+    """
+    codes = np.arange(1000)
+    first = codes // 100
+    second = (codes // 10) % 10
+    third = codes % 10
+    is_nxx = first >= 2
+    is_n11 = (second == 1) & (third == 1)
+    area_valid = is_nxx & ~is_n11 & (second != 9) & ~((first == 3) & (second == 7)) & ~((first == 9) & (second == 6))
+    exchange_valid = is_nxx & ~is_n11
+    return area_valid, exchange_valid
+
+NANP_AREA_CODES, NANP_EXCHANGE_CODES = build_nanp_code_table()
+
+def parse_phone_numbers(phone_series):
+    """
+    Vectorized phone parser. Returns a DataFrame aligned to phone_series with columns:
+    PhoneNumber (999-999-9999 or '' when unparseable), PhoneExtension, PhoneLabel,
+    DigitCount (digits in the original value) and IsValidPhone (parsed and the area and
+    exchange codes pass the NANP table lookup).
+    """
+    raw = phone_series.map(safe_str_conversion).astype(object)
+    parts = raw.str.extract(PHONE_PATTERN)
+
+    exchange = parts['exchange'].fillna('').str.upper().str.translate(PHONE_KEYPAD)
+    line = parts['line'].fillna('').str.upper().str.translate(PHONE_KEYPAD)
+    area = parts['area'].fillna('')
+    parsed = area.str.len() == 3
+
+    area_idx = pd.to_numeric(area.where(parsed, '0')).to_numpy(dtype=int)
+    exchange_idx = pd.to_numeric(exchange.where(parsed, '0')).to_numpy(dtype=int)
+    nanp_valid = NANP_AREA_CODES[area_idx] & NANP_EXCHANGE_CODES[exchange_idx]
+
+    result = pd.DataFrame(index=phone_series.index)
+    result['PhoneNumber'] = (area + '-' + exchange + '-' + line).where(parsed, '')
+    result['PhoneExtension'] = parts['extension'].fillna('')
+    result['PhoneLabel'] = parts['label'].fillna('').str.strip()
+    result['DigitCount'] = raw.str.count(r'\d')
+    result['IsValidPhone'] = parsed.to_numpy() & nanp_valid
+    return result
+
 def get_invalid_phone_number(df1, logger, first_name_col='First name', last_name_col='Last name', email_col='email', phone_col='Phone'):
     logger.info("Starting phone number validation")
-    df1['CleanPhone'] = df1[phone_col].apply(clean_phone_number)
-    df1['DigitCount'] = df1['CleanPhone'].apply(lambda x: len(re.sub(r'\D', '', safe_str_conversion(x))))
-    df1['BadLength'] = df1['DigitCount'] != 10
+    parsed = parse_phone_numbers(df1[phone_col])
+    df1['CleanPhone'] = parsed['PhoneNumber'].where(parsed['IsValidPhone'], df1[phone_col].apply(clean_phone_number))
+    df1['DigitCount'] = parsed['DigitCount']
+    df1['BadLength'] = ~parsed['IsValidPhone']
     bad_length_df = df1[df1['BadLength']]
     
     for idx in bad_length_df.index:
@@ -109,9 +181,9 @@ def get_invalid_phone_number(df1, logger, first_name_col='First name', last_name
                       f"Email: {safe_str_conversion(row.get(email_col, 'N/A'))}")
 
     if not bad_length_df.empty:
-        logger.warning(f"Found {len(bad_length_df)} phone numbers with incorrect length (not 10 digits)")
+        logger.warning(f"Found {len(bad_length_df)} phone numbers that are not valid NANP numbers")
     else:
-        logger.info("All phone numbers have exactly 10 digits after cleaning")
+        logger.info("All phone numbers are valid NANP numbers after parsing")
     
     return bad_length_df
 
@@ -167,14 +239,15 @@ def process_phone_formatting(df1, logger):
     
     logger.info("Starting phone number cleaning and formatting")
 
-    df1['CleanPhone'] = df1['Phone'].apply(clean_phone_number)
-    df1['DigitCount'] = df1['CleanPhone'].apply(lambda x: len(re.sub(r'\D', '', safe_str_conversion(x))))
-    df1['IsValidPhone'] = df1['DigitCount'] == 10
+    parsed = parse_phone_numbers(df1['Phone'])
+    df1['IsValidPhone'] = parsed['IsValidPhone']
+    df1['FormattedPhone'] = parsed['PhoneNumber'].where(parsed['IsValidPhone'], df1['Phone'].apply(safe_str_conversion))
 
-    df1['FormattedPhone'] = df1.apply(
-        lambda row: format_phone_number(row['CleanPhone']) if row['IsValidPhone'] else safe_str_conversion(row['Phone']),
-        axis=1
-    )
+    # Extensions are split into their own column so the Phone column stays importable
+    extension_count = (parsed['IsValidPhone'] & (parsed['PhoneExtension'] != '')).sum()
+    if extension_count > 0:
+        df1['Phone extension'] = parsed['PhoneExtension'].where(parsed['IsValidPhone'], '')
+        logger.info(f"   - {extension_count} phone extensions moved to 'Phone extension' column")
 
     phone_changes = df1['Phone'].apply(safe_str_conversion) != df1['FormattedPhone']
     
@@ -188,12 +261,12 @@ def process_phone_formatting(df1, logger):
     valid_count = df1['IsValidPhone'].sum()
     invalid_count = len(df1) - valid_count
 
-    df1.drop(['CleanPhone', 'DigitCount', 'IsValidPhone', 'FormattedPhone'], axis=1, inplace=True)
+    df1.drop(['IsValidPhone', 'FormattedPhone'], axis=1, inplace=True)
 
     logger.info(f"Phone processing summary:")
     logger.info(f"   - {changed_count} phone numbers changed to 999-999-9999 format")
     logger.info(f"   - {valid_count - changed_count} phone numbers already in correct format")
-    logger.info(f"   - {invalid_count} phone numbers left unchanged (invalid length)")
+    logger.info(f"   - {invalid_count} phone numbers left unchanged (not a valid NANP number)")
     logger.info(f"Phone processing completed")
 
     return {
@@ -446,6 +519,187 @@ def clean_nan_values_before_export(df, logger):
     
     return df_cleaned
 
+# Cleaned columns sent as Wild Apricot contact field values when pushing
+PUSH_FIELD_COLUMNS = ['Phone', 'Address', 'City', 'State', 'Zip']
+
+def load_push_checkpoint(checkpoint_path):
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, 'r') as checkpoint_file:
+        return json.load(checkpoint_file).get('pushed', {})
+
+def save_push_checkpoint(checkpoint_path, pushed):
+    # Write to a temp file and swap it in so an interrupted run never leaves a corrupt checkpoint
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w') as checkpoint_file:
+        json.dump({'updated_at': datetime.now().isoformat(), 'pushed': pushed}, checkpoint_file, indent=1)
+    os.replace(temp_path, checkpoint_path)
+
+# Contact properties filled from cleaned columns
+PUSH_PROPERTY_COLUMNS = {'FirstName': 'First name', 'LastName': 'Last name', 'Email': 'email'}
+
+def build_contact_values(row, event_column=None):
+    # Blank cells are left out so a push never clears what Wild Apricot already holds
+    values = {}
+    for prop, col in PUSH_PROPERTY_COLUMNS.items():
+        value = safe_str_conversion(row.get(col, ''))
+        if value != '':
+            values[prop] = value
+    field_columns = PUSH_FIELD_COLUMNS + ([event_column] if event_column else [])
+    for col in field_columns:
+        value = safe_str_conversion(row.get(col, ''))
+        if value != '':
+            values[col] = value
+    return values
+
+def build_contact_payload(values):
+    payload = {prop: value for prop, value in values.items() if prop in PUSH_PROPERTY_COLUMNS}
+    payload['FieldValues'] = [{'FieldName': col, 'Value': value}
+                              for col, value in values.items() if col not in PUSH_PROPERTY_COLUMNS]
+    return payload
+
+def push_contacts_to_wild_apricot(df, api, logger, checkpoint_path, event_column=None, workers=4, batch_size=100):
+    """
+    Create or update each cleaned row as a Wild Apricot contact, matching existing contacts
+    by email. Existing contacts only get a PUT of the non-blank values that differ from what
+    Wild Apricot holds; their email is the match key and is never rewritten. Rows are pushed in batches of batch_size with `workers` concurrent requests;
+    after each batch the pushed emails are saved to checkpoint_path, so a rerun skips them
+    and resumes where an interrupted push stopped. The checkpoint is removed once a push
+    finishes without failures.
+    """
+    logger.info(f"Starting push of {len(df)} contacts to Wild Apricot")
+    pushed = load_push_checkpoint(checkpoint_path)
+    if pushed:
+        logger.info(f"   Resuming from checkpoint {checkpoint_path}: {len(pushed)} contacts already pushed")
+
+    logger.info("Loading existing contact emails for matching")
+    existing_ids = {}
+    field_columns = PUSH_FIELD_COLUMNS + ([event_column] if event_column else [])
+    for contact in api.iter_contacts(select=['e-Mail'] + field_columns, page_size=500):
+        contact_email = safe_str_conversion(getattr(contact, 'Email', '')).lower()
+        if contact_email:
+            existing_ids[contact_email] = contact.Id
+            # Base of the update diff, so unchanged contacts cost no request
+            api.remember_contacts([contact])
+    logger.info(f"   {len(existing_ids)} existing contacts with email loaded")
+
+    contacts_url = api.get_contacts_url()
+    stats = {'created_count': 0, 'updated_count': 0, 'unchanged_count': 0, 'skipped_count': 0, 'failed_count': 0}
+    # One request per email: rows repeating an email (in any case) would otherwise be POSTed
+    # concurrently as separate contacts. The last row for an email wins, as in the sheet order.
+    pending_by_email = {}
+    for idx in df.index:
+        row = df.loc[idx]
+        row_email = safe_str_conversion(row.get('email', '')).lower()
+        if row_email == '':
+            log_correction(logger, "PUSH_SKIPPED_NO_EMAIL", row, '', '', 'email')
+            stats['skipped_count'] += 1
+        elif row_email in pushed:
+            stats['skipped_count'] += 1
+        else:
+            if row_email in pending_by_email:
+                log_correction(logger, "PUSH_DUPLICATE_EMAIL", row, '', '', 'email')
+                stats['skipped_count'] += 1
+            pending_by_email[row_email] = build_contact_values(row, event_column)
+    pending = list(pending_by_email.items())
+
+    def push_one(item):
+        row_email, values = item
+        contact_id = existing_ids.get(row_email)
+        try:
+            if contact_id is None:
+                result = api.execute_request(contacts_url, api_request_object=build_contact_payload(values),
+                                             method='POST')
+                return row_email, result.Id, 'created', None
+            desired = {name: value for name, value in values.items() if name != 'Email'}
+            if api.update_contact(contact_id, desired) is None:
+                return row_email, contact_id, 'unchanged', None
+            return row_email, contact_id, 'updated', None
+        except Exception as e:
+            return row_email, contact_id, 'failed', e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            for row_email, contact_id, outcome, error in executor.map(push_one, batch):
+                if outcome == 'failed':
+                    logger.error(f"PUSH_FAILED - Email: {row_email} | Error: {error}")
+                    stats['failed_count'] += 1
+                    continue
+                pushed[row_email] = contact_id
+                existing_ids[row_email] = contact_id
+                stats[f'{outcome}_count'] += 1
+            save_push_checkpoint(checkpoint_path, pushed)
+            logger.info(f"   Pushed {min(start + batch_size, len(pending))}/{len(pending)} contacts "
+                        f"(checkpoint saved)")
+
+    logger.info(f"Push summary:")
+    logger.info(f"   - {stats['created_count']} contacts created")
+    logger.info(f"   - {stats['updated_count']} contacts updated")
+    logger.info(f"   - {stats['unchanged_count']} contacts already up to date")
+    logger.info(f"   - {stats['skipped_count']} rows skipped (no email, duplicate email or already pushed)")
+    logger.info(f"   - {stats['failed_count']} rows failed")
+
+    # A complete push must not make the next --push of the same input skip every email
+    if stats['failed_count'] == 0 and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+        logger.info(f"   Push complete - checkpoint removed: {checkpoint_path}")
+    return stats
+
+# Columns every input must provide, from an Excel file or an event's registrations
+REQUIRED_COLUMNS = ['Last name', 'First name', 'email', 'Phone', 'Address', 'City', 'State', 'Zip']
+
+def load_event_registrations(args, logger):
+    """
+    Read the registrants of event args.event_id through the API into a DataFrame with the
+    required columns, in place of the Excel export of the registrant list. Registrants are
+    decoded as the response arrives; when --event-column is given it is set to
+    --event-value for every registrant. Form fields no registrant filled in still get their
+    (empty) column; an event without registrants ends the run.
+    """
+    logger.info(f"Loading registrations of event {args.event_id} from Wild Apricot")
+    api = create_api_client(args)
+    try:
+        df = WaApi.registrations_to_dataframe(api.iter_event_registrations(args.event_id, args.include_waitlist))
+    finally:
+        api.close()
+    if len(df) == 0:
+        logger.info(f"   Event {args.event_id} has no registrations - nothing to clean")
+        sys.exit(0)
+    # A column only appears once some registrant filled in that field
+    df = df.reindex(columns=REQUIRED_COLUMNS + [col for col in df.columns if col not in REQUIRED_COLUMNS])
+    if args.event_column and args.event_column not in df.columns:
+        df[args.event_column] = args.event_value
+        logger.info(f"   Event column '{args.event_column}' set to '{args.event_value}' for all registrants")
+    logger.info(f"   {len(df)} registrations loaded")
+    return df
+
+def get_api_credentials_error(args):
+    """Why the API options cannot authenticate, or None; checked before any work is done"""
+    if args.replay or args.api_key:
+        return None
+    if not (args.username and args.password):
+        return "An API key (--api-key or WA_API_KEY) or --username and --password are required"
+    if not (args.client_id and args.client_secret):
+        return "--username/--password also need --client-id and --client-secret (or WA_CLIENT_ID/WA_CLIENT_SECRET)"
+    return None
+
+def create_api_client(args):
+    pool = WaApi.ConnectionPool(max_per_host=args.push_workers)
+    if args.record:
+        pool = WaApi.RecordingTransport(args.record, pool)
+    elif args.replay:
+        pool = WaApi.ReplayTransport(args.replay)
+    api = WaApi.WaApiClient(args.client_id, args.client_secret,
+                            pool=pool,
+                            rate_limiter=None if args.replay else WaApi.RateLimiter(args.requests_per_minute),
+                            metrics=WaApi.ApiMetrics() if args.metrics_file else None)
+    if args.api_key or args.replay:
+        api.authenticate_with_apikey(args.api_key or 'REPLAY')
+    else:
+        api.authenticate_with_contact_credentials(args.username, args.password)
+    return api
+
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description='Clean contact data for Wild Apricot import',
@@ -455,12 +709,15 @@ Examples:
   python %(prog)s input_file.xlsx
   python %(prog)s input_file.xls --event-column "DurangoScape 2025"
   python %(prog)s input_file.xlsx --use-last-cleaned
+  python %(prog)s input_file.xlsx --event-column BulbSale2024 --push
+  python %(prog)s --event-id 4321567 --event-column "DurangoScape 2025"
         '''
     )
     
     parser.add_argument(
         'input_file',
-        help='Path to input Excel file (.xls or .xlsx)'
+        nargs='?',
+        help='Path to input Excel file (.xls or .xlsx); omit when reading registrants with --event-id'
     )
     
     parser.add_argument(
@@ -480,23 +737,76 @@ Examples:
         action='store_true',
         help='Automatically use the most recent cleaned file without prompting'
     )
+
+    api_group = parser.add_argument_group('Wild Apricot API (--event-id source and --push)')
+    api_group.add_argument('--event-id', type=int, default=None,
+                           help='Read the registrants of this event from the API instead of an input file')
+    api_group.add_argument('--include-waitlist', action='store_true',
+                           help='With --event-id, also read waitlisted registrants')
+    api_group.add_argument(
+        '--push',
+        action='store_true',
+        help='Create or update the cleaned contacts directly in Wild Apricot (matched by email)'
+    )
+    api_group.add_argument('--api-key', default=os.environ.get('WA_API_KEY'),
+                           help='Wild Apricot API key (default: WA_API_KEY environment variable)')
+    api_group.add_argument('--client-id', default=os.environ.get('WA_CLIENT_ID'),
+                           help='Application client id, used with --username/--password')
+    api_group.add_argument('--client-secret', default=os.environ.get('WA_CLIENT_SECRET'),
+                           help='Application client secret, used with --username/--password')
+    api_group.add_argument('--username', default=os.environ.get('WA_USERNAME'), help='Administrator username')
+    api_group.add_argument('--password', default=os.environ.get('WA_PASSWORD'), help='Administrator password')
+    api_group.add_argument('--push-workers', type=int, default=4, help='Concurrent API requests (default: 4)')
+    api_group.add_argument('--push-batch-size', type=int, default=100,
+                           help='Contacts per checkpointed batch (default: 100)')
+    api_group.add_argument('--requests-per-minute', type=int, default=60,
+                           help='API request rate limit (default: 60)')
+    api_group.add_argument('--checkpoint-file', default=None,
+                           help='Push progress file (default: <input>_push_checkpoint.json next to the input)')
+    api_group.add_argument('--metrics-file', default=None,
+                           help='Write API metrics of the push (.prom for Prometheus text, otherwise JSON)')
+    cassette_group = api_group.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', default=None, metavar='CASSETTE',
+                                help='Record push API requests and responses (secrets redacted) to this file')
+    cassette_group.add_argument('--replay', default=None, metavar='CASSETTE',
+                                help='Answer push API requests from a recorded cassette instead of the network')
     
     return parser.parse_args()
 
 if __name__ == "__main__":
     args = parse_arguments()
     
-    # Validate input file exists
-    if not os.path.exists(args.input_file):
-        print(f"Error: Input file not found: {args.input_file}")
-        sys.exit(1)
+    # Validate API credentials up front, not after the cleaned file has been written
+    if args.push or args.event_id is not None:
+        credentials_error = get_api_credentials_error(args)
+        if credentials_error:
+            print(f"Error: {credentials_error}")
+            sys.exit(1)
     
-    # Extract file information
-    input_path = os.path.abspath(args.input_file)
-    input_dir = os.path.dirname(input_path)
-    input_filename = os.path.basename(input_path)
-    input_basename = os.path.splitext(input_filename)[0]
-    input_ext = os.path.splitext(input_filename)[1]
+    if args.event_id is not None:
+        if args.input_file:
+            print("Error: Give either an input file or --event-id, not both")
+            sys.exit(1)
+        # Registrants come from the API; outputs go to the current directory
+        input_path = None
+        input_dir = os.getcwd()
+        input_basename = f"event_{args.event_id}_registrations"
+        input_ext = ''
+    else:
+        # Validate input file exists
+        if not args.input_file:
+            print("Error: An input file or --event-id is required")
+            sys.exit(1)
+        if not os.path.exists(args.input_file):
+            print(f"Error: Input file not found: {args.input_file}")
+            sys.exit(1)
+    
+        # Extract file information
+        input_path = os.path.abspath(args.input_file)
+        input_dir = os.path.dirname(input_path)
+        input_filename = os.path.basename(input_path)
+        input_basename = os.path.splitext(input_filename)[0]
+        input_ext = os.path.splitext(input_filename)[1]
     
     # Generate output filenames
     datetime_stamp = datetime.now().strftime('%Y%m%d_%H%M')
@@ -510,7 +820,7 @@ if __name__ == "__main__":
     logger = setup_logging(log_filepath)
     logger.info(f"Starting Wild Apricot data cleaning process")
     logger.info(f"Script: {os.path.basename(__file__)}")
-    logger.info(f"Input file: {input_path}")
+    logger.info(f"Input file: {input_path or f'Wild Apricot event {args.event_id} registrations'}")
     logger.info(f"Output file: {output_path}")
     logger.info(f"Log file: {log_filepath}")
     
@@ -540,7 +850,9 @@ if __name__ == "__main__":
 
     # Load input file
     try:
-        if input_ext.lower() == '.xls':
+        if input_path is None:
+            df1 = load_event_registrations(args, logger)
+        elif input_ext.lower() == '.xls':
             df1 = pd.read_excel(input_path, engine='xlrd')
             logger.info(f'Input file loaded (.xls format): {input_path}')
         else:
@@ -559,8 +871,7 @@ if __name__ == "__main__":
         sys.exit(1)
 
     # Validate required columns
-    required_columns = ['Last name', 'First name', 'email', 'Phone', 'Address', 'City', 'State', 'Zip']
-    missing_columns = [col for col in required_columns if col not in df1.columns]
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df1.columns]
     
     if missing_columns:
         logger.error(f"Missing required columns: {missing_columns}")
@@ -612,6 +923,26 @@ if __name__ == "__main__":
     else:
         logger.info("No changes detected - skipping output file creation")
 
+    # Push cleaned contacts to Wild Apricot
+    push_stats = {}
+    if args.push:
+        checkpoint_path = args.checkpoint_file or os.path.join(input_dir, f"{input_basename}_push_checkpoint.json")
+        try:
+            api = create_api_client(args)
+            push_stats = push_contacts_to_wild_apricot(df1, api, logger, checkpoint_path, args.event_column,
+                                                       args.push_workers, args.push_batch_size)
+            api.close()
+            if api.metrics is not None:
+                if args.metrics_file.endswith('.prom'):
+                    api.metrics.write_prometheus(args.metrics_file)
+                else:
+                    api.metrics.write_json(args.metrics_file)
+                logger.info(f"API metrics written to: {args.metrics_file}")
+        except Exception as e:
+            logger.error(f"Push to Wild Apricot failed: {e}")
+            logger.error(f"Rerun with --push to resume from checkpoint: {checkpoint_path}")
+            sys.exit(1)
+
     # Final summary
     logger.info("Final Processing Summary:")
     logger.info(f"   - Total records processed: {len(df1)}")
@@ -623,6 +954,12 @@ if __name__ == "__main__":
     logger.info(f"   - Address street standardizations: {address_standard_stats.get('street_changes', 0)}")
     logger.info(f"   - Address unit standardizations: {address_standard_stats.get('unit_changes', 0)}")
     
+    if args.push:
+        logger.info(f"   - Contacts created in Wild Apricot: {push_stats.get('created_count', 0)}")
+        logger.info(f"   - Contacts updated in Wild Apricot: {push_stats.get('updated_count', 0)}")
+        logger.info(f"   - Contacts already up to date in Wild Apricot: {push_stats.get('unchanged_count', 0)}")
+        logger.info(f"   - Contacts failed to push: {push_stats.get('failed_count', 0)}")
+    
     if args.event_column:
         logger.info(f"   - {args.event_column} valid entries: {event_stats.get('valid_count', 0)}")
         logger.info(f"   - {args.event_column} invalid/empty: {event_stats.get('invalid_count', 0) + event_stats.get('empty_count', 0)}")
@@ -12,26 +12,86 @@ Example:
 
 __author__ = 'dsmirnov@wildapricot.com'
 
+import asyncio
+import collections
+import concurrent.futures
 import datetime
-import urllib.request
-import urllib.response
+import http.client
+import email.utils
+import hashlib
+import io
+import os
+import random
+import re
+import socket
+import threading
+import weakref
+import time
 import urllib.error
 import urllib.parse
+import urllib.request
 import json
 import base64
+import codecs
+import gzip
+import zlib
 
 
 class WaApiClient(object):
     """Wild apricot API client."""
     auth_endpoint = "https://oauth.wildapricot.org/auth/token"
     api_endpoint = "https://api.wildapricot.org"
+    api_version = "v2.2"
+    account_id = None
     _token = None
     client_id = None
     client_secret = None
 
-    def __init__(self, client_id, client_secret):
+    retry_statuses = (429, 500, 502, 503, 504)
+    # contact properties update_contact sets directly; every other name is a contact field
+    contact_properties = ("FirstName", "LastName", "Email", "Organization")
+    idempotent_methods = ("GET", "HEAD", "PUT", "DELETE")
+
+    def __init__(self, client_id, client_secret, pool=None, rate_limiter=None, max_retries=3, backoff_base=1.0,
+                 backoff_max=60.0, cache=None, lazy_objects=False, token_manager=None, compress_requests_over=None,
+                 coalesce_requests=True, metrics=None, timeout=60.0, circuit_breaker=None):
+        """
+        client_id, client_secret -- application credentials
+        pool -- optional ConnectionPool to share keep-alive connections between clients
+        rate_limiter -- optional RateLimiter shared by every thread/task using this client
+        max_retries -- retries of a request answered with 429, or with 5xx or failing with a network
+                       error or timeout for idempotent methods
+        backoff_base, backoff_max -- bounds in seconds of the jittered exponential backoff between retries
+        cache -- optional ResponseCache for GET requests to slowly changing endpoints
+        lazy_objects -- return LazyApiObjects, which wrap nested values only when accessed
+        token_manager -- optional TokenManager caching tokens on disk and refreshing them in the background
+        compress_requests_over -- gzip request bodies larger than this many bytes; None never compresses
+        coalesce_requests -- concurrent identical GET requests share one request in flight and its response
+        metrics -- optional ApiMetrics (or any object with its observe_* methods) recording latency,
+                   bytes, status codes, retries, rate limit waits and token refreshes
+        timeout -- default socket timeout in seconds of each request; None waits forever
+        circuit_breaker -- optional CircuitBreaker, which fails requests to a host fast after
+                           repeated failures instead of retrying against it
+        """
         self.client_id = client_id
         self.client_secret = client_secret
+        self._pool = pool if pool is not None else ConnectionPool()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.cache = cache
+        self._object_class = LazyApiObject if lazy_objects else ApiObject
+        self.token_manager = token_manager
+        self.compress_requests_over = compress_requests_over
+        self._token_source = None
+        self._field_index = None
+        self._contact_copies = {}
+        self._single_flight = _SingleFlight() if coalesce_requests else None
+        self.metrics = metrics
+        self.timeout = timeout
+        self.circuit_breaker = circuit_breaker
+        self._token_lock = threading.Lock()
 
     def authenticate_with_apikey(self, api_key, scope=None):
         """perform authentication by api key and store result for execute_request method
@@ -44,13 +104,8 @@ class WaApiClient(object):
             "grant_type": "client_credentials",
             "scope": scope
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(self.auth_endpoint, encoded_data, method="POST")
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
-        request.add_header("Authorization", 'Basic ' + base64.standard_b64encode(('APIKEY:' + api_key).encode()).decode())
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        auth_header = base64.standard_b64encode(('APIKEY:' + api_key).encode()).decode()
+        self._request_token(data, auth_header)
 
     def authenticate_with_contact_credentials(self, username, password, scope=None):
         """perform authentication by contact credentials and store result for execute_request method
@@ -66,27 +121,83 @@ class WaApiClient(object):
             "password": password,
             "scope": scope
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(self.auth_endpoint, encoded_data, method="POST")
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
         auth_header = base64.standard_b64encode((self.client_id + ':' + self.client_secret).encode()).decode()
-        request.add_header("Authorization", 'Basic ' + auth_header)
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        self._request_token(data, auth_header)
 
-    def execute_request(self, api_url, api_request_object=None, method=None):
+    def execute_request(self, api_url, api_request_object=None, method=None, timeout=None):
         """
         perform api request and return result as an instance of ApiObject or list of ApiObjects
 
-        api_url -- absolute or relative api resource url
+        api_url -- absolute or relative api resource url, or a ContactQuery for the contacts endpoint
         api_request_object -- any json serializable object to send to API
         method -- HTTP method of api request. Default: GET if api_request_object is None else POST
+        timeout -- socket timeout in seconds for this call. Default: the client timeout
         """
+        api_url, method, body, headers = self._prepare_request(api_url, api_request_object, method)
+        if method == "GET" and self._single_flight is not None:
+            # every caller parses the shared body itself, so no ApiObject is shared between threads
+            key = (api_url, headers["Authorization"])
+            response_body = self._single_flight.do(
+                key, lambda: self._send_request(method, api_url, body, headers, timeout))
+        else:
+            response_body = self._send_request(method, api_url, body, headers, timeout)
+        return WaApiClient._parse_body(response_body, self._object_class)
+
+    @property
+    def coalesced_requests(self):
+        """number of GET calls answered by sharing another call's request in flight"""
+        return self._single_flight.coalesced if self._single_flight is not None else 0
+
+    def _send_request(self, method, api_url, body, headers, timeout=None):
+        try:
+            if method == "GET" and self.cache is not None and self.cache.ttl_for(api_url) > 0:
+                return self._cached_get(api_url, headers, timeout)
+            return self._send_with_retry(method, api_url, body, headers, timeout=timeout).read()
+        except urllib.error.HTTPError as httpErr:
+            if httpErr.code == 400:
+                raise ApiException(httpErr.read())
+            else:
+                raise
+
+    def execute_request_stream(self, api_url, array_key="Contacts", api_request_object=None, method=None,
+                               timeout=None):
+        """
+        perform api request and yield the items of one json array of the response as they
+        are received from the socket, e.g. the Contacts of a contacts query, without holding
+        the whole body, its decoded text or the full object tree in memory.
+
+        array_key -- top level key of the array to stream; None if the response itself is an array
+        timeout -- socket timeout in seconds of each read. Default: the client timeout
+        """
+        api_url, method, body, headers = self._prepare_request(api_url, api_request_object, method)
+        try:
+            response = self._send_with_retry(method, api_url, body, headers, stream=True, timeout=timeout)
+        except urllib.error.HTTPError as httpErr:
+            if httpErr.code == 400:
+                raise ApiException(httpErr.read())
+            raise
+
+        try:
+            for item in _iter_json_array(response.iter_chunks(), array_key):
+                yield self._object_class(item) if isinstance(item, dict) else item
+        finally:
+            response.close()
+
+    def execute_request_df(self, api_url, array_key="Contacts"):
+        """
+        perform a contacts api request and return the contacts as a pandas DataFrame with the
+        column names of the cleanse scripts ('First name', 'Last name', 'email', 'Phone', ...),
+        see contacts_to_dataframe. The response is decoded incrementally as it arrives.
+        """
+        return contacts_to_dataframe(self.execute_request_stream(api_url, array_key))
+
+    def _prepare_request(self, api_url, api_request_object, method):
         if self._token is None:
             raise ApiException("Access token is not abtained. "
                                "Call authenticate_with_apikey or authenticate_with_contact_credentials first.")
 
+        if isinstance(api_url, ContactQuery):
+            api_url = api_url.url(self.get_contacts_url())
         if not api_url.startswith("http"):
             api_url = self.api_endpoint + api_url
 
@@ -96,57 +207,1623 @@ class WaApiClient(object):
             else:
                 method = "POST"
 
-        request = urllib.request.Request(api_url, method=method)
+        body = None
         if api_request_object is not None:
-            request.data = json.dumps(api_request_object, cls=_ApiObjectEncoder).encode()
+            body = json.dumps(api_request_object, cls=_ApiObjectEncoder).encode()
 
-        request.add_header("Content-Type", "application/json")
-        request.add_header("Accept", "application/json")
-        request.add_header("Authorization", "Bearer " + self._get_access_token())
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Authorization": "Bearer " + self._get_access_token()
+        }
+        if body is not None and self.compress_requests_over is not None and len(body) > self.compress_requests_over:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        return api_url, method, body, headers
+
+    def _send_with_retry(self, method, api_url, body, headers, stream=False, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        host = urllib.parse.urlsplit(api_url).netloc
+        attempt = 0
+        while True:
+            if self.circuit_breaker is not None:
+                self.circuit_breaker.before_request(host)
+            if self.rate_limiter is not None:
+                wait_start = time.perf_counter()
+                self.rate_limiter.acquire()
+                if self.metrics is not None:
+                    self.metrics.observe_rate_limit_wait(time.perf_counter() - wait_start)
+            try:
+                response = self._timed_request(method, api_url, body, headers, stream, timeout)
+            except urllib.error.HTTPError as httpErr:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(host, httpErr.code < 500)
+                retryable = httpErr.code == 429 or (httpErr.code in self.retry_statuses
+                                                    and method in self.idempotent_methods)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, api_url, httpErr.code)
+                delay = self._backoff_delay(attempt)
+                retry_after = WaApiClient._parse_retry_after(httpErr.headers)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.pause(retry_after)
+                httpErr.close()
+            except (OSError, http.client.HTTPException) as error:
+                # timeouts, refused or dropped connections; nothing reached the server when the
+                # connection was refused, so that is safe to retry for any method
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(host, False)
+                retryable = method in self.idempotent_methods or isinstance(error, ConnectionRefusedError)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                if self.metrics is not None:
+                    self.metrics.observe_retry(method, api_url, None)
+                delay = self._backoff_delay(attempt)
+            else:
+                if self.circuit_breaker is not None:
+                    self.circuit_breaker.record(host, True)
+                return response
+            attempt += 1
+            time.sleep(delay)
 
+    def _timed_request(self, method, api_url, body, headers, stream=False, timeout=None):
+        if self.metrics is None:
+            return self._pool.request(method, api_url, body, headers, stream=stream, timeout=timeout)
+        start = time.perf_counter()
+        status, response_headers, response_body = None, None, None
         try:
-            response = urllib.request.urlopen(request)
-            return WaApiClient._parse_response(response)
+            response = self._pool.request(method, api_url, body, headers, stream=stream, timeout=timeout)
+            status, response_headers = response.status, response.headers
+            response_body = getattr(response, 'body', None)
+            return response
         except urllib.error.HTTPError as httpErr:
-            if httpErr.code == 400:
-                raise ApiException(httpErr.read())
+            status, response_headers = httpErr.code, httpErr.headers
+            raise
+        finally:
+            self.metrics.observe_request(method, api_url, status, time.perf_counter() - start,
+                                         len(body) if body else 0,
+                                         _response_size(response_headers, response_body))
+
+    def _cached_get(self, api_url, headers, timeout=None):
+        key = self.cache.key(api_url, self._token_scope())
+        entry = self.cache.get(key)
+        if entry is not None and entry['expires_at'] > time.time():
+            return entry['body']
+
+        if entry is not None:
+            # stale entry: revalidate with the validators the server gave us, if any
+            if entry.get('etag'):
+                headers["If-None-Match"] = entry['etag']
+            if entry.get('last_modified'):
+                headers["If-Modified-Since"] = entry['last_modified']
+        response = self._send_with_retry("GET", api_url, None, headers, timeout=timeout)
+        if response.status == 304 and entry is not None:
+            body = entry['body']
+        else:
+            body = response.read()
+            entry = {'url': api_url, 'body': body,
+                     'etag': response.headers.get("ETag"), 'last_modified': response.headers.get("Last-Modified")}
+        entry['expires_at'] = time.time() + self.cache.ttl_for(api_url)
+        self.cache.put(key, entry)
+        return body
+
+    def _token_scope(self):
+        permissions = getattr(self._token, 'Permissions', None) or []
+        return json.dumps(permissions, cls=_ApiObjectEncoder, sort_keys=True)
+
+    def _backoff_delay(self, attempt):
+        # "full jitter": uniform in [0, base * 2^attempt], so concurrent workers spread out
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    @staticmethod
+    def _parse_retry_after(headers):
+        value = headers.get("Retry-After") if headers is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            if retry_at is None:
+                return None
+            return max(0.0, (retry_at - datetime.datetime.now(retry_at.tzinfo)).total_seconds())
+
+    def iter_contacts(self, filter=None, select=None, page_size=100, stream=False):
+        """
+        generator yielding contacts one at a time, paging with $top/$skip behind the scenes.
+        The next page is fetched in the background while the current one is consumed,
+        so at most two pages are held in memory.
+
+        filter -- optional $filter expression, e.g. "member eq true", or a ContactQuery whose
+                  $filter and $select are used and whose $skip/$top set the first contact
+                  and the total number of contacts returned
+        select -- optional list of field names (or ready $select string) to return
+        page_size -- contacts requested per page
+        stream -- decode each page incrementally with execute_request_stream instead of
+                  prefetching whole pages; memory stays bounded by one contact
+        """
+        params = {'$async': 'false'}
+        params.update(WaApiClient._contact_query_params(filter, select))
+        if isinstance(filter, ContactQuery):
+            return self._iter_pages(self.get_contacts_url(), params, page_size, stream,
+                                    filter.skip_count or 0, filter.top_count)
+        return self._iter_pages(self.get_contacts_url(), params, page_size, stream)
+
+    def submit_contacts_query(self, filter=None, select=None):
+        """
+        submit an asynchronous ($async=true) contacts query and return the ApiObject
+        holding its ResultId and ResultUrl. Use for large accounts where a synchronous
+        query times out.
+        """
+        params = {'$async': 'true'}
+        params.update(WaApiClient._contact_query_params(filter, select))
+        return self.execute_request(self.get_contacts_url() + '?' + urllib.parse.urlencode(params))
+
+    def wait_for_async_result(self, result_url, initial_delay=0.5, max_delay=15.0, timeout=900.0):
+        """
+        poll ResultUrl of an asynchronous query until it is complete and return the last status.
+        The delay doubles while the server reports no progress, up to max_delay, and drops
+        back to initial_delay as soon as the processed count moves.
+
+        Raises ApiException if the query fails or does not complete within timeout seconds.
+        """
+        deadline = time.monotonic() + timeout
+        delay = initial_delay
+        last_processed = None
+        poll_url = result_url + ('&' if '?' in result_url else '?') + '$top=1'
+        while True:
+            status = self.execute_request(poll_url)
+            state = getattr(status, 'State', None)
+            if state == 'Complete':
+                return status
+            if state == 'Failed':
+                raise ApiException("Async query failed: " + str(getattr(status, 'ErrorDetails', status)))
+
+            processed = getattr(status, 'Processed', None)
+            if last_processed is not None and processed == last_processed:
+                delay = min(delay * 2, max_delay)
             else:
-                raise
+                delay = initial_delay
+            last_processed = processed
+
+            if time.monotonic() + delay > deadline:
+                raise ApiException("Async query did not complete within %s seconds: %s" % (timeout, result_url))
+            time.sleep(delay)
+
+    def iter_contacts_async(self, filter=None, select=None, page_size=500, stream=False, **poll_options):
+        """
+        generator yielding contacts of a large query through the asynchronous query API:
+        submit with $async=true, poll ResultUrl with adaptive backoff (see wait_for_async_result),
+        then stream the result pages with $top/$skip as in iter_contacts. A ContactQuery
+        filter's $skip/$top select the first contact and the total count, as in iter_contacts.
+        """
+        result_url = self.submit_contacts_query(filter, select).ResultUrl
+        self.wait_for_async_result(result_url, **poll_options)
+        start, limit = (filter.skip_count or 0, filter.top_count) if isinstance(filter, ContactQuery) else (0, None)
+        for contact in self._iter_pages(result_url, {}, page_size, stream, start, limit):
+            yield contact
+
+    def _iter_pages(self, url, params, page_size, stream=False, start=0, limit=None):
+        end = None if limit is None else start + limit
+
+        def page_top(skip):
+            return page_size if end is None else min(page_size, end - skip)
+
+        def page_url(skip):
+            page_params = dict(params, **{'$top': str(page_top(skip)), '$skip': str(skip)})
+            return url + ('&' if '?' in url else '?') + urllib.parse.urlencode(page_params)
+
+        def fetch_page(skip):
+            return self.execute_request(page_url(skip)).Contacts
+
+        def has_more(skip, received, requested):
+            return received >= requested and (end is None or skip < end)
+
+        if stream:
+            skip = start
+            while page_top(skip) > 0:
+                requested = page_top(skip)
+                received = 0
+                for contact in self.execute_request_stream(page_url(skip)):
+                    received += 1
+                    yield contact
+                skip += received
+                if not has_more(skip, received, requested):
+                    return
+            return
+
+        if page_top(start) <= 0:
+            return
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        try:
+            skip = start
+            next_page = executor.submit(fetch_page, skip)
+            while next_page is not None:
+                requested = page_top(skip)
+                page = next_page.result()
+                skip += len(page)
+                next_page = executor.submit(fetch_page, skip) if has_more(skip, len(page), requested) else None
+                for contact in page:
+                    yield contact
+                del page
+        finally:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def _contact_query_params(filter, select):
+        if isinstance(filter, ContactQuery):
+            params = filter.params(paging=False)
+            del params['$async']
+            if select is not None:
+                params.update(WaApiClient._contact_query_params(None, select))
+            return params
+        params = {}
+        if filter is not None:
+            params['$filter'] = filter
+        if select is not None:
+            params['$select'] = select if isinstance(select, str) else ",".join("'%s'" % name for name in select)
+        return params
+
+    def iter_event_registrations(self, event_id, include_waitlist=False):
+        """
+        generator yielding the registrations of an event (with their RegistrationFields),
+        decoded incrementally as the response arrives. The endpoint has no paging and
+        returns all registrations of the event in one array.
+        """
+        params = {'eventId': str(event_id)}
+        if include_waitlist:
+            params['includeWaitlist'] = 'true'
+        registrations_url = "%s/%s/accounts/%s/eventregistrations?%s" % (
+            self.api_endpoint, self.api_version, self._get_account_id(), urllib.parse.urlencode(params))
+        return self.execute_request_stream(registrations_url, array_key=None)
+
+    def get_contact_fields(self):
+        """contact field definitions of the account (FieldName, SystemCode, Type, ...), fetched once"""
+        return self.get_field_index().fields
+
+    def get_field_index(self):
+        """ContactFieldIndex over the account contact fields, built on first use and kept for the client"""
+        if self._field_index is None:
+            fields_url = "%s/%s/accounts/%s/contactfields" % (self.api_endpoint, self.api_version,
+                                                              self._get_account_id())
+            self._field_index = ContactFieldIndex(self.execute_request(fields_url))
+        return self._field_index
+
+    def bulk_update_contacts(self, contact_ids, payload_for, workers=4):
+        """
+        send one PUT per contact with up to `workers` requests in flight (each still passing
+        the client rate limiter and retries) and return a result table in the order of
+        contact_ids: one dict per contact with Id, Status ("ok" or "failed") and Error.
+        A failing contact does not stop the others.
+
+        payload_for -- function of a contact id returning the PUT body for that contact
+        """
+        contacts_url = self.get_contacts_url()
+
+        def update(contact_id):
+            self.execute_request(contacts_url + "/" + str(contact_id), payload_for(contact_id), "PUT")
+            return 'ok'
+
+        return self._run_bulk(contact_ids, update, workers)
+
+    @staticmethod
+    def _run_bulk(contact_ids, action, workers):
+        # action returns the Status of one contact; exceptions become "failed" rows
+        def run(contact_id):
+            try:
+                return {'Id': contact_id, 'Status': action(contact_id), 'Error': None}
+            except Exception as e:
+                return {'Id': contact_id, 'Status': 'failed', 'Error': str(e)}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, contact_ids))
+
+    def get_contact(self, contact_id):
+        """fetch one contact and remember a copy of it as the base of update_contact"""
+        contact = self.execute_request(self.get_contacts_url() + "/" + str(contact_id))
+        self.remember_contacts([contact])
+        return contact
+
+    def remember_contacts(self, contacts):
+        """remember copies of contacts fetched elsewhere (e.g. iter_contacts) as the base of update_contact"""
+        for contact in contacts:
+            state = json.loads(json.dumps(contact, cls=_ApiObjectEncoder))
+            self._contact_copies[state['Id']] = state
+
+    def diff_contact(self, contact_id, desired, current=None):
+        """
+        minimal PUT payload taking a contact from its current state to `desired`, or None if
+        nothing would change. Properties and fields not named in desired are left alone.
+
+        desired -- dict of contact_properties and field names or system codes to values
+        current -- the contact as last seen; default the remembered copy, fetched if there is none
+        """
+        if current is None:
+            current = self._contact_copies.get(contact_id)
+            if current is None:
+                self.get_contact(contact_id)
+                current = self._contact_copies[contact_id]
+        current = json.loads(json.dumps(current, cls=_ApiObjectEncoder))
+        current_fields = {field.get('FieldName'): field.get('Value') for field in current.get('FieldValues') or []}
+
+        payload = {'Id': contact_id}
+        changed_fields = {}
+        for name, value in desired.items():
+            value = json.loads(json.dumps(value, cls=_ApiObjectEncoder))
+            if name in self.contact_properties:
+                if not _same_value(current.get(name), value):
+                    payload[name] = value
+                continue
+            field_name = self.get_field_index().field(name).FieldName
+            if not _same_value(current_fields.get(field_name), value):
+                changed_fields[name] = value
+        if changed_fields:
+            payload['FieldValues'] = self.get_field_index().build_update(contact_id, changed_fields)['FieldValues']
+        return payload if len(payload) > 1 else None
+
+    def update_contact(self, contact_id, desired, current=None):
+        """
+        PUT only the properties and fields of `desired` that differ from the contact's current
+        state (see diff_contact) and return the api response, or None without any request if
+        nothing changed. The remembered copy is replaced by the updated contact.
+        """
+        payload = self.diff_contact(contact_id, desired, current)
+        if payload is None:
+            return None
+        response = self.execute_request(self.get_contacts_url() + "/" + str(contact_id), payload, "PUT")
+        if getattr(response, 'Id', None) == contact_id:
+            # the api answers with the updated contact, including mirrored fields
+            self.remember_contacts([response])
+        else:
+            self._apply_to_copy(contact_id, payload)
+        return response
+
+    def update_contacts(self, desired_by_id, workers=4):
+        """
+        update_contact for many contacts with up to `workers` requests in flight; returns a
+        result table like bulk_update_contacts with Status "ok", "unchanged" or "failed"
+        """
+        def update(contact_id):
+            return 'ok' if self.update_contact(contact_id, desired_by_id[contact_id]) is not None else 'unchanged'
+
+        return self._run_bulk(list(desired_by_id), update, workers)
+
+    def _apply_to_copy(self, contact_id, payload):
+        state = self._contact_copies.get(contact_id)
+        if state is None:
+            return
+        for name, value in payload.items():
+            if name != 'FieldValues':
+                state[name] = value
+        field_values = state.setdefault('FieldValues', [])
+        positions = {field.get('FieldName'): i for i, field in enumerate(field_values)}
+        for field in payload.get('FieldValues', []):
+            if field['FieldName'] in positions:
+                field_values[positions[field['FieldName']]]['Value'] = field['Value']
+            else:
+                field_values.append(dict(field))
+
+    def bulk_archive_contacts(self, contact_ids, workers=4):
+        """archive contacts, see bulk_update_contacts"""
+        return self.bulk_update_contacts(
+            contact_ids, lambda contact_id: {'Id': contact_id,
+                                             'FieldValues': [{'FieldName': 'Archived', 'Value': 'true'}]},
+            workers)
+
+    def bulk_set_field(self, contact_ids, field, value, workers=4):
+        """set one contact field (FieldName or SystemCode) to the same value on every contact"""
+        index = self.get_field_index()
+        index.field(field)
+        return self.bulk_update_contacts(
+            contact_ids, lambda contact_id: index.build_update(contact_id, {field: value}), workers)
+
+    def bulk_flag_event(self, contact_ids, event_field, value="Yes", workers=4):
+        """mark event participation, e.g. bulk_flag_event(ids, "DurangoScape 2025")"""
+        return self.bulk_set_field(contact_ids, event_field, value, workers)
+
+    def _get_account_id(self):
+        if self.account_id is None:
+            permissions = getattr(self._token, 'Permissions', None) if self._token is not None else None
+            if permissions:
+                self.account_id = permissions[0].AccountId
+            else:
+                self.account_id = self.execute_request("/v2/accounts")[0].Id
+        return self.account_id
+
+    def get_contacts_url(self):
+        """absolute url of the account contacts resource"""
+        return "%s/%s/accounts/%s/contacts" % (self.api_endpoint, self.api_version, self._get_account_id())
 
     def _get_access_token(self):
-        expires_at = self._token.retrieved_at + datetime.timedelta(seconds=self._token.expires_in - 100)
-        if datetime.datetime.utcnow() > expires_at:
-            self._refresh_auth_token()
-        return self._token.access_token
+        with self._token_lock:
+            if self._token_source is not None:
+                token = self.token_manager.get_token(*self._token_source)
+                if token["access_token"] != self._token.access_token:
+                    self._set_token(token)
+                return self._token.access_token
+            expires_at = self._token.retrieved_at + datetime.timedelta(seconds=self._token.expires_in - 100)
+            if datetime.datetime.now() > expires_at:
+                self._refresh_auth_token()
+            return self._token.access_token
 
     def _refresh_auth_token(self):
         data = {
             "grant_type": "refresh_token",
             "refresh_token": self._token.refresh_token
         }
-        encoded_data = urllib.parse.urlencode(data).encode()
-        request = urllib.request.Request(self.auth_endpoint, encoded_data, method="POST")
-        request.add_header("ContentType", "application/x-www-form-urlencoded")
-        auth_header = base64.standard_b64encode((self.client_id + ':' + self.client_secret).encode()).decode()
-        request.add_header("Authorization", 'Basic ' + auth_header)
-        response = urllib.request.urlopen(request)
-        self._token = WaApiClient._parse_response(response)
-        self._token.retrieved_at = datetime.datetime.now()
+        # refresh with the credentials the token was obtained with (api key or client id/secret)
+        self._request_token(data, self._auth_header)
+
+    def _request_token(self, data, auth_header):
+        self._auth_header = auth_header
+        if self.token_manager is not None and data["grant_type"] != "refresh_token":
+            def authenticate():
+                return self._fetch_token(data, auth_header)
+
+            def refresh(refresh_token):
+                return self._fetch_token({"grant_type": "refresh_token", "refresh_token": refresh_token}, auth_header)
+
+            self._token_source = (TokenManager.key(self.auth_endpoint, auth_header, data), authenticate, refresh)
+            self._set_token(self.token_manager.get_token(*self._token_source))
+        else:
+            self._set_token(self._fetch_token(data, auth_header))
+
+    def _fetch_token(self, data, auth_header):
+        start = time.perf_counter()
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept-Encoding": "gzip, deflate",
+            "Authorization": 'Basic ' + auth_header
+        }
+        response = self._pool.request("POST", self.auth_endpoint, urllib.parse.urlencode(data).encode(), headers,
+                                      timeout=self.timeout)
+        token = json.loads(response.read().decode())
+        token["expires_at"] = time.time() + token["expires_in"]
+        if self.metrics is not None:
+            self.metrics.observe_token_refresh(data["grant_type"], time.perf_counter() - start)
+        return token
+
+    def _set_token(self, token):
+        # copy, ApiObject converts nested dicts of its state in place
+        self._token = ApiObject(json.loads(json.dumps(token)))
+        self._token.retrieved_at = datetime.datetime.now() - datetime.timedelta(
+            seconds=token["expires_in"] - (token["expires_at"] - time.time()))
+
+    def close(self):
+        """close pooled keep-alive connections"""
+        self._pool.close()
 
     @staticmethod
-    def _parse_response(http_response):
-        decoded = json.loads(http_response.read().decode())
+    def _parse_body(body, object_class=None):
+        object_class = ApiObject if object_class is None else object_class
+        decoded = json.loads(body.decode())
         if isinstance(decoded, list):
             result = []
             for item in decoded:
-                result.append(ApiObject(item))
+                result.append(object_class(item))
             return result
         elif isinstance(decoded, dict):
-            return ApiObject(decoded)
+            return object_class(decoded)
         else:
             return None
 
 
+class AsyncWaApiClient(object):
+    """
+    asyncio front end for WaApiClient with the same authenticate_* and execute_request
+    methods as coroutines, returning the same ApiObjects. Up to `concurrency` requests run
+    at once over a keep-alive pool of the same size, so network latency of many calls overlaps.
+
+    Example:
+        api = WaApi.AsyncWaApiClient("CLIENT_ID", "CLIENT_SECRET", concurrency=8)
+        await api.authenticate_with_apikey("API_KEY")
+        events = await asyncio.gather(*[api.execute_request(url) for url in registration_urls])
+    """
+
+    def __init__(self, client_id, client_secret, concurrency=8, pool=None, **client_options):
+        """
+        client_id, client_secret -- application credentials
+        concurrency -- maximum number of requests in flight at once
+        pool -- optional ConnectionPool; by default one with concurrency connections per host
+        client_options -- passed to WaApiClient, e.g. rate_limiter or max_retries
+        """
+        self.concurrency = concurrency
+        pool = pool if pool is not None else ConnectionPool(max_per_host=concurrency)
+        self.client = WaApiClient(client_id, client_secret, pool=pool, **client_options)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency)
+
+    @property
+    def auth_endpoint(self):
+        return self.client.auth_endpoint
+
+    @auth_endpoint.setter
+    def auth_endpoint(self, value):
+        self.client.auth_endpoint = value
+
+    @property
+    def api_endpoint(self):
+        return self.client.api_endpoint
+
+    @api_endpoint.setter
+    def api_endpoint(self, value):
+        self.client.api_endpoint = value
+
+    async def authenticate_with_apikey(self, api_key, scope=None):
+        """see WaApiClient.authenticate_with_apikey"""
+        await self._run(self.client.authenticate_with_apikey, api_key, scope)
+
+    async def authenticate_with_contact_credentials(self, username, password, scope=None):
+        """see WaApiClient.authenticate_with_contact_credentials"""
+        await self._run(self.client.authenticate_with_contact_credentials, username, password, scope)
+
+    async def execute_request(self, api_url, api_request_object=None, method=None, timeout=None):
+        """see WaApiClient.execute_request"""
+        return await self._run(self.client.execute_request, api_url, api_request_object, method, timeout)
+
+    @property
+    def coalesced_requests(self):
+        """see WaApiClient.coalesced_requests"""
+        return self.client.coalesced_requests
+
+    async def close(self):
+        """wait for running requests and close pooled connections"""
+        await self._run(self.client.close)
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+
+class _SingleFlight(object):
+    """
+    Runs one call per key at a time: callers arriving with the key of a call still in flight
+    wait for it and get its result (or its exception) instead of starting their own.
+    """
+
+    class _Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _SingleFlight._Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class ApiMetrics(object):
+    """
+    Metrics hook for WaApiClient(metrics=...): per-endpoint latency histograms, request and
+    response bytes, status codes, retries, time spent waiting on the rate limiter and token
+    refreshes, so a slow job shows whether auth, rate limiting, payload size or server latency
+    is the cause. Endpoints are url paths with numeric ids replaced by {id}. One instance can
+    be shared by several clients. Any object with the same observe_* methods can be passed
+    instead, e.g. to forward the numbers to another metrics system.
+
+    Example:
+        metrics = WaApi.ApiMetrics()
+        api = WaApi.WaApiClient("CLIENT_ID", "CLIENT_SECRET", metrics=metrics)
+        ...
+        metrics.write_prometheus("wa_sync.prom")
+    """
+    default_buckets = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, buckets=None):
+        self.buckets = tuple(sorted(buckets)) if buckets else self.default_buckets
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._statuses = collections.Counter()
+        self._request_bytes = collections.Counter()
+        self._response_bytes = collections.Counter()
+        self._retries = collections.Counter()
+        self._token_refreshes = collections.Counter()
+        self._token_refresh_seconds = collections.Counter()
+        self._rate_limit_wait = 0.0
+
+    @staticmethod
+    def endpoint(url):
+        """url path with numeric path segments replaced by {id}"""
+        path = urllib.parse.urlsplit(url).path or "/"
+        return "/".join("{id}" if segment.isdigit() else segment for segment in path.split("/"))
+
+    def observe_request(self, method, url, status, seconds, request_bytes, response_bytes):
+        """one HTTP request; status is None when no response was received"""
+        key = (method, ApiMetrics.endpoint(url))
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+            self._statuses[key + (str(status) if status is not None else "error",)] += 1
+            self._request_bytes[key] += request_bytes
+            self._response_bytes[key] += response_bytes
+
+    def observe_retry(self, method, url, status):
+        with self._lock:
+            self._retries[(method, ApiMetrics.endpoint(url), str(status) if status is not None else "error")] += 1
+
+    def observe_rate_limit_wait(self, seconds):
+        with self._lock:
+            self._rate_limit_wait += seconds
+
+    def observe_token_refresh(self, grant_type, seconds):
+        with self._lock:
+            self._token_refreshes[grant_type] += 1
+            self._token_refresh_seconds[grant_type] += seconds
+
+    def to_dict(self):
+        """snapshot of all metrics as json serializable dict"""
+        with self._lock:
+            endpoints = []
+            for (method, endpoint), histogram in sorted(self._latency.items()):
+                key = (method, endpoint)
+                endpoints.append({
+                    'method': method,
+                    'endpoint': endpoint,
+                    'count': histogram['count'],
+                    'latency_sum': histogram['sum'],
+                    'latency_buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'],
+                                                histogram['buckets'] + [histogram['count']])),
+                    'statuses': {status: count for (m, e, status), count in sorted(self._statuses.items())
+                                 if (m, e) == key},
+                    'retries': {status: count for (m, e, status), count in sorted(self._retries.items())
+                                if (m, e) == key},
+                    'request_bytes': self._request_bytes[key],
+                    'response_bytes': self._response_bytes[key]})
+            return {
+                'endpoints': endpoints,
+                'token_refreshes': {grant_type: {'count': count, 'seconds': self._token_refresh_seconds[grant_type]}
+                                    for grant_type, count in sorted(self._token_refreshes.items())},
+                'rate_limit_wait_seconds': self._rate_limit_wait}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """metrics in the Prometheus text exposition format"""
+        snapshot = self.to_dict()
+        lines = ["# HELP waapi_request_duration_seconds Wild Apricot API request latency",
+                 "# TYPE waapi_request_duration_seconds histogram"]
+        for item in snapshot['endpoints']:
+            labels = 'method="%s",endpoint="%s"' % (item['method'], item['endpoint'])
+            for bound, count in item['latency_buckets'].items():
+                lines.append('waapi_request_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, count))
+            lines.append('waapi_request_duration_seconds_sum{%s} %f' % (labels, item['latency_sum']))
+            lines.append('waapi_request_duration_seconds_count{%s} %d' % (labels, item['count']))
+        for name, kind, help_text, field in (
+                ("waapi_requests_total", "counter", "Requests by response status", 'statuses'),
+                ("waapi_retries_total", "counter", "Retried requests by response status", 'retries')):
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s %s" % (name, kind)]
+            for item in snapshot['endpoints']:
+                for status, count in item[field].items():
+                    lines.append('%s{method="%s",endpoint="%s",status="%s"} %d'
+                                 % (name, item['method'], item['endpoint'], status, count))
+        for name, help_text, field in (("waapi_request_bytes_total", "Request body bytes sent", 'request_bytes'),
+                                       ("waapi_response_bytes_total", "Response body bytes received",
+                                        'response_bytes')):
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s counter" % name]
+            for item in snapshot['endpoints']:
+                lines.append('%s{method="%s",endpoint="%s"} %d' % (name, item['method'], item['endpoint'],
+                                                                   item[field]))
+        lines += ["# HELP waapi_token_refreshes_total Access tokens obtained by grant type",
+                  "# TYPE waapi_token_refreshes_total counter"]
+        for grant_type, item in snapshot['token_refreshes'].items():
+            lines.append('waapi_token_refreshes_total{grant_type="%s"} %d' % (grant_type, item['count']))
+        lines += ["# HELP waapi_token_refresh_seconds_total Time spent obtaining access tokens",
+                  "# TYPE waapi_token_refresh_seconds_total counter"]
+        for grant_type, item in snapshot['token_refreshes'].items():
+            lines.append('waapi_token_refresh_seconds_total{grant_type="%s"} %f' % (grant_type, item['seconds']))
+        lines += ["# HELP waapi_rate_limit_wait_seconds_total Time spent waiting for the rate limiter",
+                  "# TYPE waapi_rate_limit_wait_seconds_total counter",
+                  "waapi_rate_limit_wait_seconds_total %f" % snapshot['rate_limit_wait_seconds']]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_file_atomic(path, self.to_json())
+
+    def write_prometheus(self, path):
+        _write_file_atomic(path, self.to_prometheus())
+
+
+class AccountRegistry(object):
+    """
+    WaApiClients for several Wild Apricot accounts, so the jobs of all accounts run in one
+    parallel window. Each account has its own client, and so its own access token, and its
+    own RateLimiter bucket; all clients share one ConnectionPool, so connections to the API
+    host are reused across accounts. Clients authenticate on first use.
+
+    Example:
+        registry = WaApi.AccountRegistry()
+        registry.add_account("dbg", api_key=os.environ["WA_API_KEY_DBG"])
+        registry.add_account("friends", api_key=os.environ["WA_API_KEY_FRIENDS"], requests_per_minute=120)
+        for row in registry.run(lambda name, api: sum(1 for _ in api.iter_contacts())):
+            print(row['Account'], row['Status'], row['Result'])
+    """
+
+    def __init__(self, pool=None, max_per_host=16):
+        """
+        pool -- optional ConnectionPool shared by every account
+        max_per_host -- connections per host of the pool created when pool is None
+        """
+        self.pool = pool if pool is not None else ConnectionPool(max_per_host=max_per_host)
+        self._accounts = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_account(self, name, api_key=None, client_id=None, client_secret=None, username=None, password=None,
+                    requests_per_minute=60, **client_options):
+        """
+        register an account authenticating by api_key, or by username/password with the
+        application client_id/client_secret, and return its (not yet authenticated) client
+
+        requests_per_minute -- size of the account's own RateLimiter bucket; None for no limit
+        client_options -- passed to WaApiClient, e.g. token_manager, metrics or lazy_objects
+        """
+        if not api_key:
+            if not (username and password):
+                raise ApiException("Account %s needs an api_key or username and password" % name)
+            if not (client_id and client_secret):
+                raise ApiException("Account %s needs client_id and client_secret with username and password" % name)
+        rate_limiter = RateLimiter(requests_per_minute) if requests_per_minute else None
+        client = WaApiClient(client_id, client_secret, pool=self.pool, rate_limiter=rate_limiter, **client_options)
+        if api_key:
+            def authenticate():
+                client.authenticate_with_apikey(api_key)
+        else:
+            def authenticate():
+                client.authenticate_with_contact_credentials(username, password)
+        with self._lock:
+            if name in self._accounts:
+                raise ApiException("Account %s is already registered" % name)
+            self._accounts[name] = {'client': client, 'authenticate': authenticate, 'lock': threading.Lock()}
+        return client
+
+    def names(self):
+        with self._lock:
+            return list(self._accounts)
+
+    def client(self, name):
+        """authenticated client of an account"""
+        with self._lock:
+            account = self._accounts.get(name)
+        if account is None:
+            raise ApiException("Unknown account: " + str(name))
+        with account['lock']:
+            if account['client']._token is None:
+                account['authenticate']()
+        return account['client']
+
+    def run(self, job, names=None, max_workers=None):
+        """
+        call job(name, client) for every account (or the given names) concurrently and return
+        a result table in account order: one dict per account with Account, Status ("ok" or
+        "failed"), Result (the job's return value), Error and Seconds. A failing account does
+        not stop the others.
+        """
+        names = self.names() if names is None else list(names)
+
+        def run_account(name):
+            start = time.perf_counter()
+            try:
+                result = job(name, self.client(name))
+                return {'Account': name, 'Status': 'ok', 'Result': result, 'Error': None,
+                        'Seconds': time.perf_counter() - start}
+            except Exception as e:
+                return {'Account': name, 'Status': 'failed', 'Result': None, 'Error': str(e),
+                        'Seconds': time.perf_counter() - start}
+
+        if not names:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(names)) as executor:
+            return list(executor.map(run_account, names))
+
+    def close(self):
+        """close the shared pool's idle connections"""
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RateLimiter(object):
+    """
+    Token bucket keeping request rate just under the API limit. acquire() blocks until a
+    request may be sent; the bucket refills at requests_per_minute and holds at most
+    `burst` tokens. Thread safe, so one instance can be shared by all threads, async tasks
+    (AsyncWaApiClient runs requests on threads) and clients of the same account.
+    """
+
+    def __init__(self, requests_per_minute, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(1, requests_per_minute // 10)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """block until a request slot is available and take it"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """hold every caller for `seconds`, e.g. after the server answered 429 with Retry-After"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker. After failure_threshold consecutive failures (network errors,
+    timeouts or 5xx) against a host the circuit opens and requests to it fail immediately
+    with CircuitOpenError for reset_timeout seconds; then one trial request is let through,
+    which closes the circuit on success or opens it again on failure. Thread safe, so one
+    instance can be shared by several clients.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = {}
+        self._opened_at = {}
+        self._trial_started = {}
+        self._lock = threading.Lock()
+
+    def before_request(self, host):
+        """raise CircuitOpenError if requests to host are currently blocked"""
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            remaining = opened_at + self.reset_timeout - time.monotonic()
+            trial_started = self._trial_started.get(host)
+            if remaining > 0 or (trial_started is not None and
+                                 time.monotonic() - trial_started < self.reset_timeout):
+                raise CircuitOpenError("Circuit open for %s after %d consecutive failures, retry in %.0f seconds"
+                                       % (host, self._failures.get(host, 0), max(remaining, 0)))
+            self._trial_started[host] = time.monotonic()
+
+    def record(self, host, success):
+        """record the outcome of a request to host"""
+        with self._lock:
+            self._trial_started.pop(host, None)
+            if success:
+                self._failures.pop(host, None)
+                self._opened_at.pop(host, None)
+                return
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if self._failures[host] >= self.failure_threshold:
+                self._opened_at[host] = time.monotonic()
+
+    def is_open(self, host):
+        with self._lock:
+            return host in self._opened_at
+
+
+class TokenManager(object):
+    """
+    Process-wide access token source for WaApiClient (pass token_manager=...). Tokens are
+    kept in memory and, when cache_path is given, in a json file created with owner-only
+    permissions, so the next script run starts without an OAuth round trip. A background
+    thread refreshes each token refresh_margin seconds before it expires, so requests do not
+    stall on a refresh mid-batch. The cache file is guarded by a lock file: threads and worker
+    processes can share it, and a process finding a fresher token on disk uses it instead of
+    refreshing again.
+    """
+
+    def __init__(self, cache_path=None, refresh_margin=300, background_refresh=True):
+        """
+        cache_path -- optional json file for tokens shared between runs and processes
+        refresh_margin -- seconds before expiry at which the background thread refreshes a token
+        background_refresh -- start the refresh thread; otherwise tokens refresh on first use after expiry
+        """
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self._tokens = {}
+        self._sources = {}
+        # _lock only guards the dicts; token requests for a key are serialized by its renew lock,
+        # so a refresh in progress never blocks callers that still hold a valid token
+        self._lock = threading.RLock()
+        self._renew_locks = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_pid = None
+        if cache_path:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+
+    @staticmethod
+    def key(auth_endpoint, auth_header, data):
+        """cache key for a set of credentials; a hash, so no secret is written to disk"""
+        identity = "|".join([auth_endpoint, auth_header, data["grant_type"], data.get("username", ""),
+                             data.get("password", ""), data.get("scope", "")])
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    def get_token(self, key, authenticate, refresh):
+        """
+        return a valid token dict for key: from memory, else from the cache file, else by calling
+        refresh(refresh_token) or authenticate(). Both callables return a token dict with expires_at.
+        """
+        with self._lock:
+            self._sources[key] = (authenticate, refresh)
+            token = self._tokens.get(key)
+            self._start_refresh_thread()
+        if token is not None and not self._expires_within(token, 60):
+            return token
+        with self._renew_lock(key):
+            # another thread may have renewed the token while this one waited
+            with self._lock:
+                token = self._tokens.get(key)
+            if token is None or self._expires_within(token, 60):
+                token = self._renew(key, token, 60)
+            return token
+
+    def stop(self):
+        """stop the background refresh thread"""
+        thread = self._thread
+        self._thread = None
+        self._wakeup.set()
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join()
+
+    def _renew_lock(self, key):
+        with self._lock:
+            return self._renew_locks.setdefault(key, threading.Lock())
+
+    def _renew(self, key, token, margin):
+        # called with the key's renew lock held, never with _lock
+        with self._lock:
+            authenticate, refresh = self._sources[key]
+        with _FileLock(self.cache_path + ".lock") if self.cache_path else _NullLock():
+            cached = self._read_cache().get(key)
+            if cached is not None and (token is None or cached["expires_at"] > token["expires_at"]):
+                token = cached
+            if token is None:
+                token = authenticate()
+            elif self._expires_within(token, margin):
+                try:
+                    token = refresh(token["refresh_token"])
+                except (urllib.error.URLError, http.client.HTTPException, KeyError):
+                    token = authenticate()
+            with self._lock:
+                self._tokens[key] = token
+            self._write_cache(key, token)
+        # let the refresh thread reschedule around the new expiry
+        self._wakeup.set()
+        return token
+
+    def _expires_within(self, token, seconds):
+        return time.time() > token["expires_at"] - seconds
+
+    def _start_refresh_thread(self):
+        if not self.background_refresh:
+            return
+        # a forked worker process does not inherit the parent's thread
+        if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        self._wakeup.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="WaApi-token-refresh", daemon=True)
+        self._thread_pid = os.getpid()
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while self._thread is threading.current_thread():
+            # cleared before reading the tokens, so a token stored from here on wakes the next wait
+            self._wakeup.clear()
+            with self._lock:
+                due = [(token["expires_at"] - self.refresh_margin, key) for key, token in self._tokens.items()]
+            now = time.time()
+            for refresh_at, key in due:
+                if refresh_at <= now:
+                    try:
+                        with self._renew_lock(key):
+                            with self._lock:
+                                token = self._tokens[key]
+                            if self._expires_within(token, self.refresh_margin):
+                                self._renew(key, token, self.refresh_margin)
+                    except Exception:
+                        # keep the thread alive; a failing refresh is retried here and on next use
+                        pass
+            with self._lock:
+                wait = min([token["expires_at"] - self.refresh_margin for token in self._tokens.values()] or [now + 60])
+            self._wakeup.wait(min(max(wait - time.time(), 5), 300))
+
+    def _read_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, key, token):
+        if not self.cache_path:
+            return
+        tokens = self._read_cache()
+        tokens[key] = token
+        tokens = {k: t for k, t in tokens.items() if t["expires_at"] > time.time() - 14 * 86400}
+        temp_path = self.cache_path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump(tokens, cache_file)
+        os.replace(temp_path, self.cache_path)
+
+
+class _FileLock(object):
+    """cross-process lock on a lock file created exclusively; stale lock files are taken over"""
+
+    def __init__(self, path, timeout=30.0, stale_after=60.0):
+        self.path = path
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self._fd = None
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise ApiException("Timed out waiting for lock " + self.path)
+                time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc, tb):
+        os.close(self._fd)
+        os.remove(self.path)
+
+
+class _NullLock(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+class ResponseCache(object):
+    """
+    Cache of GET response bodies for endpoints that rarely change (accounts, account
+    resources, contact field definitions). Entries are kept in memory and, when directory
+    is given, as json files so the next script run starts warm. Keys combine the url and
+    the token's account permissions, so different accounts or scopes never share entries.
+    Expired entries are revalidated with If-None-Match / If-Modified-Since when the server
+    sent an ETag or Last-Modified header.
+    """
+    default_ttls = (
+        (r'/v2(\.\d+)?/accounts/?(\?.*)?$', 3600),
+        (r'/v2(\.\d+)?/accounts/\d+/?(\?.*)?$', 3600),
+        (r'/v2(\.\d+)?/accounts/\d+/contactfields', 3600),
+        (r'/v2(\.\d+)?/accounts/\d+/membershiplevels', 3600),
+    )
+
+    def __init__(self, directory=None, ttls=None, default_ttl=0):
+        """
+        directory -- optional folder for the on-disk cache; None keeps the cache in memory only
+        ttls -- sequence of (url regex, seconds) checked in order; defaults to default_ttls
+        default_ttl -- seconds for urls matching no pattern; 0 means not cached
+        """
+        self.directory = directory
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls if ttls is not None else self.default_ttls)]
+        self.default_ttl = default_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def ttl_for(self, url):
+        path = urllib.parse.urlsplit(url)
+        path = path.path + ('?' + path.query if path.query else '')
+        for pattern, ttl in self.ttls:
+            if pattern.search(path):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def key(url, scope):
+        return hashlib.sha256((scope + '|' + url).encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None and self.directory is not None:
+            try:
+                with open(self._path(key), 'r') as cache_file:
+                    entry = json.load(cache_file)
+            except (OSError, ValueError):
+                return None
+            entry['body'] = entry['body'].encode()
+            with self._lock:
+                self._entries[key] = entry
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+        if self.directory is not None:
+            temp_path = self._path(key) + '.tmp'
+            with open(temp_path, 'w') as cache_file:
+                json.dump(dict(entry, body=entry['body'].decode()), cache_file)
+            os.replace(temp_path, self._path(key))
+
+    def clear(self):
+        """drop all entries from memory and disk"""
+        with self._lock:
+            self._entries = {}
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.directory, name))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+
+class ConnectionPool(object):
+    """
+    Pool of keep-alive http.client connections, so consecutive requests to the same host
+    reuse one TCP connection and TLS session instead of paying a new handshake each call.
+    At most max_per_host connections per host are open at once; extra callers wait.
+    A pool is thread safe and can be shared by several WaApiClient instances.
+    Like urlopen, connections go through the proxy of the HTTPS_PROXY / HTTP_PROXY
+    environment variables (CONNECT tunnel) unless NO_PROXY exempts the host.
+    """
+
+    def __init__(self, max_per_host=4, timeout=None):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, body=None, headers=None, stream=False, timeout=None):
+        """
+        send request over a pooled connection and return a fully read PooledResponse, or with
+        stream=True a StreamingResponse that holds the connection until it is read or closed.
+        gzip or deflate encoded bodies are decompressed transparently in both cases.
+        Responses with status >= 400 raise urllib.error.HTTPError like urlopen does.
+
+        timeout -- socket timeout in seconds for this request; None uses the pool timeout
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        slot = self._get_slot(key)
+        slot.acquire()
+        try:
+            connection, http_response = self._request_with_reconnect(key, method, path, body, headers or {},
+                                                                     self.timeout if timeout is None else timeout)
+        except Exception:
+            slot.release()
+            raise
+
+        if stream and http_response.status < 400:
+            return StreamingResponse(self, key, connection, http_response, slot)
+        try:
+            decompressor = _Decompressor(http_response.headers.get("Content-Encoding"))
+            response = PooledResponse(http_response.status, http_response.reason, http_response.headers,
+                                      decompressor.decompress(http_response.read()) + decompressor.flush())
+            self._finish(key, connection, http_response)
+        except Exception:
+            connection.close()
+            raise
+        finally:
+            slot.release()
+
+        if response.status >= 400:
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers,
+                                         io.BytesIO(response.body))
+        return response
+
+    def close(self):
+        """close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request_with_reconnect(self, key, method, path, body, headers, timeout):
+        connection, reused = self._acquire(key)
+        try:
+            ConnectionPool._set_timeout(connection, timeout)
+            connection.request(method, path, body=body, headers=headers)
+            http_response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # the server dropped an idle keep-alive connection, retry once on a fresh one
+            connection, reused = self._new_connection(key), False
+            ConnectionPool._set_timeout(connection, timeout)
+            connection.request(method, path, body=body, headers=headers)
+            http_response = connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+        return connection, http_response
+
+    @staticmethod
+    def _set_timeout(connection, timeout):
+        # pooled connections are shared between calls with different timeouts
+        connection.timeout = socket.getdefaulttimeout() if timeout is None else timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(connection.timeout)
+
+    def _finish(self, key, connection, http_response):
+        # a connection can only be reused once its response has been read to the end
+        if http_response.isclosed() and not http_response.will_close:
+            self._release(key, connection)
+        else:
+            connection.close()
+
+    def _get_slot(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    def _acquire(self, key):
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop(), True
+        return self._new_connection(key), False
+
+    def _release(self, key, connection):
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = urllib.request.getproxies().get(scheme)
+        if not proxy or urllib.request.proxy_bypass(host):
+            return connection_class(host, port, timeout=self.timeout)
+        proxy_parts = urllib.parse.urlsplit(proxy if "://" in proxy else "http://" + proxy)
+        headers = {}
+        if proxy_parts.username is not None:
+            credentials = "%s:%s" % (urllib.parse.unquote(proxy_parts.username),
+                                     urllib.parse.unquote(proxy_parts.password or ""))
+            headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode()).decode()
+        connection = connection_class(proxy_parts.hostname, proxy_parts.port or 80, timeout=self.timeout)
+        connection.set_tunnel(host, port or (443 if scheme == "https" else 80), headers)
+        return connection
+
+
+class PooledResponse(object):
+    """Fully read HTTP response returned by ConnectionPool"""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def getcode(self):
+        return self.status
+
+
+class _Decompressor(object):
+    """incremental decoder for a Content-Encoding of gzip, deflate or none"""
+
+    def __init__(self, content_encoding):
+        encoding = (content_encoding or "").strip().lower()
+        self._raw_fallback = encoding == "deflate"
+        if encoding in ("gzip", "x-gzip"):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == "deflate":
+            self._decompressor = zlib.decompressobj(zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+
+    def decompress(self, data):
+        if self._decompressor is None:
+            return data
+        try:
+            result = self._decompressor.decompress(data)
+        except zlib.error:
+            if not self._raw_fallback:
+                raise
+            # some servers send "deflate" without the zlib header
+            self._raw_fallback = False
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            result = self._decompressor.decompress(data)
+        self._raw_fallback = False
+        return result
+
+    def flush(self):
+        return self._decompressor.flush() if self._decompressor is not None else b""
+
+
+class StreamingResponse(object):
+    """
+    HTTP response returned by ConnectionPool.request(stream=True). The body is read as it
+    arrives with iter_chunks(); the connection goes back to the pool once the body has been
+    read to the end, or is closed if the response is closed early.
+    """
+
+    def __init__(self, pool, key, connection, http_response, slot):
+        self.status = http_response.status
+        self.reason = http_response.reason
+        self.headers = http_response.headers
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = http_response
+        self._slot = slot
+        self._closed = False
+
+    def iter_chunks(self, chunk_size=65536):
+        """yield (decompressed) body bytes as they are received, reading at most chunk_size at a time"""
+        decompressor = _Decompressor(self.headers.get("Content-Encoding"))
+        try:
+            while True:
+                chunk = self._response.read1(chunk_size)
+                if not chunk:
+                    break
+                chunk = decompressor.decompress(chunk)
+                if chunk:
+                    yield chunk
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+        finally:
+            self.close()
+
+    def read(self):
+        return b"".join(self.iter_chunks())
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._pool._finish(self._key, self._connection, self._response)
+        finally:
+            self._slot.release()
+
+
+class RecordingTransport(object):
+    """
+    Stand-in for ConnectionPool (pass as WaApiClient(pool=...)) that sends requests through
+    a real pool and appends every request/response pair to a json lines cassette for
+    ReplayTransport. Authorization headers, passwords, api keys and tokens are redacted
+    before anything is written. Response bodies are stored decompressed; streamed
+    responses are read in full while recording.
+
+    Example:
+        api = WaApi.WaApiClient("CLIENT_ID", "CLIENT_SECRET", pool=WaApi.RecordingTransport("sync.cassette"))
+    """
+    secret_keys = ("password", "refresh_token", "access_token", "client_secret", "api_key", "Authorization")
+
+    def __init__(self, cassette_path, pool=None):
+        self.cassette_path = cassette_path
+        self._pool = pool if pool is not None else ConnectionPool()
+        self._lock = threading.Lock()
+        self._file = open(cassette_path, "a", encoding="utf-8")
+
+    def request(self, method, url, body=None, headers=None, stream=False, timeout=None):
+        entry = {'method': method, 'url': url, 'request_headers': self._redact(dict(headers or {})),
+                 'request_body': self._redact_body(body, (headers or {}).get("Content-Type"))}
+        start = time.perf_counter()
+        try:
+            response = self._pool.request(method, url, body, headers, timeout=timeout)
+            status, reason, response_headers, response_body = (response.status, response.reason,
+                                                               response.headers, response.body)
+        except urllib.error.HTTPError as httpErr:
+            status, reason, response_headers, response_body = (httpErr.code, httpErr.reason,
+                                                               httpErr.headers, httpErr.read())
+        except (OSError, http.client.HTTPException) as error:
+            entry.update(elapsed=time.perf_counter() - start, error=type(error).__name__, message=str(error))
+            self._write(entry)
+            raise
+
+        entry.update(elapsed=time.perf_counter() - start, status=status, reason=reason,
+                     headers={name: value for name, value in response_headers.items()
+                              if name.lower() not in ("content-encoding", "content-length", "set-cookie")},
+                     body=self._redact_body(response_body, response_headers.get("Content-Type")))
+        self._write(entry)
+        return _replay_response(url, status, reason, entry['headers'], response_body, stream)
+
+    def close(self):
+        self._pool.close()
+        with self._lock:
+            self._file.close()
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def _redact(self, value):
+        if isinstance(value, dict):
+            return {key: "REDACTED" if key in self.secret_keys else self._redact(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._redact(item) for item in value]
+        return value
+
+    def _redact_body(self, body, content_type):
+        if not body:
+            return None
+        try:
+            text = body.decode()
+        except UnicodeDecodeError:
+            return {'base64': base64.standard_b64encode(body).decode()}
+        if content_type and "x-www-form-urlencoded" in content_type:
+            return urllib.parse.urlencode(self._redact(dict(urllib.parse.parse_qsl(text))))
+        try:
+            return {'json': self._redact(json.loads(text))}
+        except ValueError:
+            return text
+
+
+class ReplayTransport(object):
+    """
+    Stand-in for ConnectionPool answering requests from a cassette written by
+    RecordingTransport, without any network. Requests are matched on method, path and
+    query (not the host) in recorded order; once the recordings of a request are used up
+    the last one is repeated. Recorded network errors are raised again.
+
+    timing -- sleep the recorded response time of each request, divided by speed, to
+              reproduce a job's real pacing; by default responses return immediately
+    """
+
+    def __init__(self, cassette_path, timing=False, speed=1.0):
+        self.timing = timing
+        self.speed = speed
+        self._recordings = {}
+        self._lock = threading.Lock()
+        with open(cassette_path, encoding="utf-8") as cassette:
+            for line in cassette:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._recordings.setdefault(ReplayTransport._match_key(entry['method'], entry['url']),
+                                                collections.deque()).append(entry)
+
+    def request(self, method, url, body=None, headers=None, stream=False, timeout=None):
+        with self._lock:
+            recordings = self._recordings.get(ReplayTransport._match_key(method, url))
+            if not recordings:
+                raise ApiException("No recorded response for %s %s" % (method, url))
+            entry = recordings.popleft() if len(recordings) > 1 else recordings[0]
+        if self.timing:
+            time.sleep(entry['elapsed'] / self.speed)
+        if 'error' in entry:
+            error_class = socket.timeout if entry['error'] in ("timeout", "TimeoutError") else ConnectionError
+            raise error_class(entry['message'])
+
+        recorded_body = entry.get('body')
+        if recorded_body is None:
+            response_body = b""
+        elif isinstance(recorded_body, dict) and 'json' in recorded_body:
+            response_body = json.dumps(recorded_body['json']).encode()
+        elif isinstance(recorded_body, dict):
+            response_body = base64.standard_b64decode(recorded_body['base64'])
+        else:
+            response_body = recorded_body.encode()
+        response = _replay_response(url, entry['status'], entry['reason'], entry['headers'], response_body, stream)
+        return response
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _match_key(method, url):
+        parts = urllib.parse.urlsplit(url)
+        return method, parts.path, parts.query
+
+
+class _ReplayStream(object):
+    """StreamingResponse look-alike over an already read body"""
+
+    def __init__(self, status, reason, headers, body):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = body
+
+    def iter_chunks(self, chunk_size=65536):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def read(self):
+        return self._body
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        pass
+
+
+def _replay_response(url, status, reason, headers, body, stream):
+    if not isinstance(headers, http.client.HTTPMessage):
+        message = http.client.HTTPMessage()
+        for name, value in headers.items():
+            message[name] = value
+        headers = message
+    if status >= 400:
+        raise urllib.error.HTTPError(url, status, reason, headers, io.BytesIO(body))
+    if stream:
+        return _ReplayStream(status, reason, headers, body)
+    return PooledResponse(status, reason, headers, body)
+
+
 class ApiException(Exception):
     def __init__(self, value):
         self.value = value
@@ -155,6 +1832,10 @@ class ApiException(Exception):
         return repr(self.value)
 
 
+class CircuitOpenError(ApiException):
+    """raised instead of sending a request to a host whose CircuitBreaker is open"""
+
+
 class ApiObject(object):
     """Represent any api call input or output object"""
 
@@ -179,8 +1860,429 @@ class ApiObject(object):
         return json.dumps(self.__dict__)
 
 
+class ContactQuery(object):
+    """
+    Builder for contacts endpoint queries composing $filter, $select, $top and $skip with
+    field names and values quoted correctly, so callers ask only for the contacts and fields
+    they need. Pass it to execute_request, or to iter_contacts / iter_contacts_async in
+    place of the filter argument.
+
+    Example:
+        query = (WaApi.ContactQuery()
+                 .select("e-Mail", "Phone", "DurangoScape 2025")
+                 .where("Archived", "eq", False)
+                 .where("Profile last updated", "ge", datetime.date(2025, 1, 1)))
+        for contact in api.iter_contacts(query, page_size=500):
+            ...
+    """
+    operators = ("eq", "ne", "gt", "ge", "lt", "le", "substringof")
+
+    def __init__(self):
+        self.conditions = []
+        self.fields = []
+        self.top_count = None
+        self.skip_count = None
+
+    def where(self, field, operator, value):
+        """add a condition, joined to the others with `and`"""
+        operator = operator.lower()
+        if operator not in ContactQuery.operators:
+            raise ValueError("Unsupported $filter operator: " + operator)
+        if operator == "substringof":
+            self.conditions.append("substringof(%s, %s)" % (ContactQuery.quote(field),
+                                                            ContactQuery.literal(str(value))))
+        else:
+            self.conditions.append("%s %s %s" % (ContactQuery.quote(field), operator, ContactQuery.literal(value)))
+        return self
+
+    def where_expression(self, expression):
+        """add a ready $filter expression, joined to the others with `and`"""
+        self.conditions.append("(%s)" % expression if " or " in expression.lower() else expression)
+        return self
+
+    def select(self, *fields):
+        """return only these fields (FieldName) of each contact"""
+        self.fields.extend(fields)
+        return self
+
+    def top(self, count):
+        self.top_count = int(count)
+        return self
+
+    def skip(self, count):
+        self.skip_count = int(count)
+        return self
+
+    def params(self, paging=True):
+        """query string parameters; synchronous ($async=false) unless overridden by the caller"""
+        params = {'$async': 'false'}
+        if self.conditions:
+            params['$filter'] = " and ".join(self.conditions)
+        if self.fields:
+            params['$select'] = ",".join(ContactQuery.quote(field) for field in self.fields)
+        if paging and self.top_count is not None:
+            params['$top'] = str(self.top_count)
+        if paging and self.skip_count is not None:
+            params['$skip'] = str(self.skip_count)
+        return params
+
+    def url(self, contacts_url):
+        return contacts_url + ('&' if '?' in contacts_url else '?') + urllib.parse.urlencode(self.params())
+
+    @staticmethod
+    def quote(field):
+        return "'%s'" % field.replace("'", "''")
+
+    @staticmethod
+    def literal(value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (int, float)):
+            return repr(value)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        return "'%s'" % str(value).replace("'", "''")
+
+    def __str__(self):
+        return urllib.parse.urlencode(self.params())
+
+
+class ContactFieldIndex(object):
+    """
+    Index over contact field definitions giving O(1) access to a contact's field values by
+    FieldName or SystemCode, instead of scanning contact.FieldValues for every lookup. The
+    per-contact lookup table is built once per contact object and reused.
+
+    Example:
+        index = api.get_field_index()
+        if index.value(contact, "GOT 2024") != "Yes":
+            api.execute_request(contact_url, index.build_update(contact.Id, {"GOT 2024": "Yes"}), "PUT")
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self._by_name = {}
+        self._by_code = {}
+        for field in fields:
+            self._by_name[field.FieldName] = field
+            system_code = getattr(field, "SystemCode", None)
+            if system_code:
+                self._by_code[system_code] = field
+        self._contact_maps = weakref.WeakKeyDictionary()
+
+    def field(self, name_or_code):
+        """field definition by FieldName or SystemCode; ApiException if the account has no such field"""
+        field = self._by_name.get(name_or_code) or self._by_code.get(name_or_code)
+        if field is None:
+            raise ApiException("Unknown contact field: " + str(name_or_code))
+        return field
+
+    def value(self, contact, name_or_code, default=None):
+        """value of a contact field by FieldName or SystemCode"""
+        values = self.field_map(contact)
+        if name_or_code in values:
+            return values[name_or_code]
+        field = self._by_code.get(name_or_code)
+        return values.get(field.FieldName, default) if field is not None else default
+
+    def field_map(self, contact):
+        """dict of FieldName -> value for a contact, computed once per contact object"""
+        try:
+            return self._contact_maps[contact]
+        except (KeyError, TypeError):
+            pass
+        values = {field.FieldName: field.Value for field in getattr(contact, "FieldValues", None) or []}
+        try:
+            self._contact_maps[contact] = values
+        except TypeError:
+            pass
+        return values
+
+    def build_update(self, contact_id, values):
+        """
+        minimal PUT payload setting only the given fields, values keyed by FieldName or SystemCode
+        """
+        field_values = []
+        for name_or_code, value in values.items():
+            field = self.field(name_or_code)
+            field_values.append({"FieldName": field.FieldName, "SystemCode": getattr(field, "SystemCode", None),
+                                 "Value": value})
+        return {"Id": contact_id, "FieldValues": field_values}
+
+
+# Contact properties and field names renamed to the columns the cleanse scripts expect;
+# any other FieldName becomes a column of the same name.
+CONTACT_COLUMNS = {
+    "Id": "Id",
+    "FirstName": "First name",
+    "LastName": "Last name",
+    "Email": "email",
+    "Organization": "Organization",
+    "Status": "Status",
+}
+FIELD_NAME_COLUMNS = {
+    "e-Mail": "email",
+    "Zip code": "Zip",
+    "Postal code": "Zip",
+}
+# Event registration properties, as paths into the registration, renamed to columns;
+# RegistrationFields are named via FIELD_NAME_COLUMNS like contact fields.
+REGISTRATION_COLUMNS = {
+    ("Contact", "Id"): "Id",
+    ("Id",): "Registration Id",
+    ("Event", "Name"): "Event",
+    ("RegistrationDate",): "Registration date",
+    ("IsPaid",): "Paid",
+    ("Organization",): "Organization",
+}
+
+
+def contacts_to_dataframe(contacts):
+    """
+    Build a pandas DataFrame from an iterable of contact ApiObjects (or dicts), one row per
+    contact. Fixed contact properties and every FieldValues FieldName become columns, named
+    via CONTACT_COLUMNS / FIELD_NAME_COLUMNS. Values are written straight into column lists
+    through a field-name-to-column index, so each contact is processed in one pass.
+    """
+    return _records_to_dataframe(contacts, {(prop,): name for prop, name in CONTACT_COLUMNS.items()},
+                                 "FieldValues")
+
+
+def registrations_to_dataframe(registrations):
+    """
+    Build a pandas DataFrame from an iterable of event registrations, e.g. from
+    iter_event_registrations, one row per registrant: the registration form fields with the
+    cleanse script column names ('First name', 'Last name', 'email', 'Phone', 'Address', ...)
+    plus the contact Id and the registration properties of REGISTRATION_COLUMNS.
+    """
+    return _records_to_dataframe(registrations, REGISTRATION_COLUMNS, "RegistrationFields")
+
+
+def _records_to_dataframe(records, property_columns, fields_key):
+    import pandas as pd
+
+    column_names = []
+    column_index = {}
+    columns = []
+    row_count = 0
+
+    def column_for(key, name):
+        position = column_index.get(key)
+        if position is None:
+            position = column_index.get(name)
+            if position is None:
+                position = len(columns)
+                column_names.append(name)
+                columns.append([None] * row_count)
+                column_index[name] = position
+            column_index[key] = position
+        return columns[position]
+
+    for record in records:
+        state = _object_state(record)
+        for column in columns:
+            column.append(None)
+        row_count += 1
+
+        for path, name in property_columns.items():
+            value = state
+            for key in path:
+                value = _object_state(value)
+                if not isinstance(value, dict) or key not in value:
+                    break
+                value = value[key]
+            else:
+                column_for(("prop", path), name)[-1] = value
+        for field in state.get(fields_key) or []:
+            field = _object_state(field)
+            value = _field_value_to_cell(field.get("Value"))
+            if value is None:
+                continue
+            field_name = field.get("FieldName")
+            column_for(("field", field_name), FIELD_NAME_COLUMNS.get(field_name, field_name))[-1] = value
+
+    return pd.DataFrame(dict(zip(column_names, columns)), columns=column_names)
+
+
+def _same_value(current, desired):
+    # missing, null and empty string all mean "no value" to the api
+    if current in (None, "") and desired in (None, ""):
+        return True
+    return current == desired
+
+
+def _response_size(headers, body):
+    """bytes on the wire: Content-Length when the server sent one, else the (decompressed) body length"""
+    length = headers.get("Content-Length") if headers is not None else None
+    if length and length.isdigit():
+        return int(length)
+    return len(body) if body is not None else 0
+
+
+def _write_file_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _object_state(obj):
+    # underlying dict of an ApiObject or LazyApiObject; plain dicts pass through
+    if isinstance(obj, LazyApiObject):
+        return obj._state
+    if isinstance(obj, ApiObject):
+        return vars(obj)
+    return obj
+
+
+def _field_value_to_cell(value):
+    # choice fields come back as {"Id": .., "Label": ..} or a list of them
+    value = _object_state(value)
+    if isinstance(value, dict):
+        return value.get("Label", value.get("Value"))
+    if isinstance(value, list):
+        return ", ".join(str(_field_value_to_cell(item)) for item in value)
+    return value
+
+
+def _iter_json_array(chunks, array_key=None):
+    """
+    Incrementally decode a json document arriving as byte chunks and yield the elements
+    of its top level array, or of the array under top level key array_key, one at a time.
+    Only the undecoded tail of the input is buffered.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    state = {"buffer": "", "pos": 0, "exhausted": False}
+
+    def read_more():
+        chunk = next(chunks, None)
+        tail = state["buffer"][state["pos"]:]
+        if chunk is None:
+            if state["exhausted"]:
+                raise ValueError("Unexpected end of json stream")
+            state["exhausted"] = True
+            tail += text_decoder.decode(b"", final=True)
+        else:
+            tail += text_decoder.decode(chunk)
+        state["buffer"], state["pos"] = tail, 0
+
+    def next_char():
+        # skip whitespace and return the next significant character without consuming it
+        while True:
+            buffer, pos = state["buffer"], state["pos"]
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            state["pos"] = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            read_more()
+
+    # find the opening bracket of the array to stream
+    if array_key is None:
+        if next_char() != "[":
+            raise ValueError("Expected a json array")
+    else:
+        depth = 0
+        while True:
+            char = next_char()
+            state["pos"] += 1
+            if char in "{[":
+                depth += 1
+            elif char in "}]":
+                depth -= 1
+                if depth == 0:
+                    return
+            elif char == '"':
+                try:
+                    string, end = json.decoder.scanstring(state["buffer"], state["pos"])
+                except ValueError:
+                    state["pos"] -= 1
+                    read_more()
+                    continue
+                state["pos"] = end
+                if depth == 1 and string == array_key and next_char() == ":":
+                    state["pos"] += 1
+                    if next_char() == "[":
+                        break
+    state["pos"] += 1
+
+    while True:
+        char = next_char()
+        if char == "]":
+            break
+        if char == ",":
+            state["pos"] += 1
+            continue
+        try:
+            item, end = decoder.raw_decode(state["buffer"], state["pos"])
+        except ValueError:
+            read_more()
+            continue
+        if not state["exhausted"] and (
+            end == len(state["buffer"])
+            or (isinstance(item, (int, float)) and not isinstance(item, bool)
+                and state["buffer"][end] not in ",] \t\r\n")
+        ):
+            # a scalar could continue in the next chunk, e.g. "2." or "1e" before "5"
+            read_more()
+            continue
+        state["pos"] = end
+        yield item
+
+    # drain the rest of the document so the connection can be reused
+    for _ in chunks:
+        pass
+
+
+class LazyApiObject(ApiObject):
+    """
+    ApiObject that keeps the decoded json dict as is and wraps nested dicts and lists only
+    when an attribute is read; the wrapped value is cached for later reads. Setting an
+    attribute writes through to the dict, so encoding returns the dict without copying.
+    Lists are wrapped into new lists: assign a new list instead of appending in place.
+    """
+
+    def __init__(self, state):
+        self.__dict__['_state'] = state
+
+    def __getattr__(self, name):
+        if name == '_state':
+            raise AttributeError(name)
+        try:
+            value = self._state[name]
+        except KeyError:
+            raise AttributeError(name)
+        if isinstance(value, dict):
+            value = LazyApiObject(value)
+        elif isinstance(value, list):
+            value = [LazyApiObject(item) if isinstance(item, dict) else item for item in value]
+        self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        self._state[name] = value
+        self.__dict__[name] = value
+
+    def __delattr__(self, name):
+        del self._state[name]
+        self.__dict__.pop(name, None)
+
+    def __dir__(self):
+        return list(self._state)
+
+    def __str__(self):
+        return json.dumps(self._state, cls=_ApiObjectEncoder)
+
+    def __repr__(self):
+        return json.dumps(self._state, cls=_ApiObjectEncoder)
+
+
 class _ApiObjectEncoder(json.JSONEncoder):
     def default(self, obj):
+        if isinstance(obj, LazyApiObject):
+            return obj._state
         if isinstance(obj, ApiObject):
             return obj.__dict__
         # Let the base class default method raise the TypeError
@@ -0,0 +1,147 @@
+r"""
+Throughput benchmarks for WaApi.WaApiClient against the local WaApiMockServer stand-in,
+so they run without a live account or credentials. Each benchmark reports requests/sec
+and MB/s on the wire (as counted by the mock server).
+
+Usage:
+    python WaApiBenchmark.py
+    python WaApiBenchmark.py --contacts 20000 --latency 0.02 --concurrency 16
+    python WaApiBenchmark.py --parse-only
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import urllib.request
+
+import WaApi
+import WaApiMockServer
+
+
+def make_client(server, **client_options):
+    # identical GETs would otherwise be coalesced and never reach the server
+    client_options.setdefault("coalesce_requests", False)
+    api = WaApi.WaApiClient("CLIENT_ID", "CLIENT_SECRET", **client_options)
+    server.configure_client(api)
+    api.authenticate_with_apikey("API_KEY")
+    return api
+
+
+def bench_urlopen(server, count):
+    """baseline: a new urllib connection per request, as WaApiClient did before pooling"""
+    api = make_client(server)
+    url = api.get_contacts_url() + "?$async=false&$top=10"
+    headers = {"Accept": "application/json", "Authorization": "Bearer " + api._get_access_token()}
+    for _ in range(count):
+        request = urllib.request.Request(url, headers=headers)
+        json.loads(urllib.request.urlopen(request).read().decode())
+    return count
+
+
+def bench_pooled_requests(server, count):
+    api = make_client(server)
+    url = api.get_contacts_url() + "?$async=false&$top=10"
+    for _ in range(count):
+        api.execute_request(url)
+    api.close()
+    return count
+
+
+def bench_async_requests(server, count, concurrency, coalesce_requests=False):
+    """
+    `count` identical GETs from the async client. With coalesce_requests the calls that
+    shared a request in flight are reported, and only requests the server received count.
+    """
+    async def run():
+        async with WaApi.AsyncWaApiClient("CLIENT_ID", "CLIENT_SECRET", concurrency=concurrency,
+                                          coalesce_requests=coalesce_requests) as api:
+            server.configure_client(api)
+            await api.authenticate_with_apikey("API_KEY")
+            url = api.client.get_contacts_url() + "?$async=false&$top=10"
+            await asyncio.gather(*[api.execute_request(url) for _ in range(count)])
+            return api.coalesced_requests
+    coalesced = asyncio.run(run())
+    if coalesce_requests:
+        print("   %d of %d calls coalesced" % (coalesced, count))
+    return count - coalesced
+
+
+def bench_iter_contacts(server, page_size, stream=False, gzip_responses=True, lazy_objects=False):
+    server.gzip_responses = gzip_responses
+    api = make_client(server, lazy_objects=lazy_objects)
+    contacts = sum(1 for _ in api.iter_contacts(page_size=page_size, stream=stream))
+    api.close()
+    server.gzip_responses = True
+    return contacts // page_size + 1
+
+
+def run_benchmark(server, name, func, *args, **kwargs):
+    server.reset_stats()
+    start = time.perf_counter()
+    count = func(server, *args, **kwargs)
+    elapsed = time.perf_counter() - start
+    megabytes = (server.stats["bytes_sent"] + server.stats["bytes_received"]) / 1e6
+    print("%-32s %6d requests %8.3f s %9.1f req/s %8.2f MB/s" % (name, count, elapsed, count / elapsed,
+                                                                 megabytes / elapsed))
+
+
+def make_contacts_body(count, fields_per_contact=40):
+    contacts = [{"Id": i, "FirstName": "First", "LastName": "Last", "Email": "contact%d@example.org" % i,
+                 "Status": "Active", "MembershipLevel": {"Id": 1, "Name": "Member", "Url": "u"},
+                 "FieldValues": [{"FieldName": "Field %d" % f, "SystemCode": "custom-%d" % f, "Value": "value %d" % f}
+                                 for f in range(fields_per_contact)]}
+                for i in range(count)]
+    return json.dumps({"Contacts": contacts}).encode()
+
+
+def bench_parse_encode(count, rounds=3):
+    """parse a contacts page, read Id/Email of every contact, encode it back; best of `rounds`"""
+    body = make_contacts_body(count)
+    print("%d contacts, %.1f MB json" % (count, len(body) / 1e6))
+    for name, object_class in (("ApiObject (eager)", WaApi.ApiObject), ("LazyApiObject", WaApi.LazyApiObject)):
+        parse_times, encode_times = [], []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            page = WaApi.WaApiClient._parse_body(body, object_class)
+            for contact in page.Contacts:
+                contact.Id, contact.Email
+            parse_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            json.dumps(page, cls=WaApi._ApiObjectEncoder)
+            encode_times.append(time.perf_counter() - start)
+        print("   %-20s parse+access %8.1f ms   encode %8.1f ms" % (name, min(parse_times) * 1000,
+                                                                      min(encode_times) * 1000))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark WaApiClient against the local WaApiMockServer')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per request benchmark (default: 500)')
+    parser.add_argument('--contacts', type=int, default=5000, help='Contacts on the mock server (default: 5000)')
+    parser.add_argument('--page-size', type=int, default=500, help='Contacts per page when paging (default: 500)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Server latency per request in seconds')
+    parser.add_argument('--concurrency', type=int, default=8, help='AsyncWaApiClient concurrency (default: 8)')
+    parser.add_argument('--parse-only', action='store_true', help='Only run the json parse/encode benchmarks')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    for contact_count in (1000, 10000):
+        bench_parse_encode(contact_count)
+    if args.parse_only:
+        sys.exit(0)
+
+    with WaApiMockServer.MockWaApiServer(contact_count=args.contacts, latency=args.latency) as server:
+        print("Mock server: %d contacts, %.3f s latency" % (args.contacts, args.latency))
+        run_benchmark(server, "urlopen per request", bench_urlopen, args.requests)
+        run_benchmark(server, "pooled keep-alive client", bench_pooled_requests, args.requests)
+        run_benchmark(server, "async client x%d" % args.concurrency, bench_async_requests, args.requests,
+                      args.concurrency)
+        run_benchmark(server, "async client x%d coalesced" % args.concurrency, bench_async_requests, args.requests,
+                      args.concurrency, coalesce_requests=True)
+        run_benchmark(server, "iter_contacts (gzip)", bench_iter_contacts, args.page_size)
+        run_benchmark(server, "iter_contacts (identity)", bench_iter_contacts, args.page_size, gzip_responses=False)
+        run_benchmark(server, "iter_contacts lazy objects", bench_iter_contacts, args.page_size, lazy_objects=True)
+        run_benchmark(server, "iter_contacts streaming decode", bench_iter_contacts, args.page_size, stream=True)
@@ -0,0 +1,539 @@
+r"""
+Local stand-in for the Wild Apricot API v2, built on http.server, so WaApi.py can be tested
+and benchmarked without a live account or credentials.
+
+Implements the oauth token endpoint, /v2/accounts, the account record and the paged contacts
+resource (GET with $top/$skip/$filter/$select/$async, GET/POST/PUT by id, contact field
+definitions) and event registrations (contacts flagged in the EVENTS fields), with configurable latency, per-minute rate limits, error injection and gzip.
+
+Example:
+    with WaApiMockServer.MockWaApiServer(contact_count=5000, latency=0.02) as server:
+        api = WaApi.WaApiClient("CLIENT_ID", "CLIENT_SECRET")
+        server.configure_client(api)
+        api.authenticate_with_apikey("API_KEY")
+        contacts = list(api.iter_contacts())
+
+Standalone:
+    python WaApiMockServer.py --port 8080 --contacts 5000 --latency 0.05 --requests-per-minute 120
+"""
+
+import argparse
+import collections
+import datetime
+import gzip
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ACCOUNT_ID = 101
+
+CONTACT_FIELDS = [
+    # (FieldName, SystemCode, Type)
+    ("First name", "FirstName", "String"),
+    ("Last name", "LastName", "String"),
+    ("e-Mail", "Email", "Email"),
+    ("Organization", "Organization", "String"),
+    ("Phone", "Phone", "String"),
+    ("Address", "custom-1001", "String"),
+    ("City", "custom-1002", "String"),
+    ("State", "custom-1003", "String"),
+    ("Zip", "custom-1004", "String"),
+    ("Archived", "IsArchived", "Boolean"),
+    ("Profile last updated", "LastUpdated", "DateTime"),
+    ("GOT 2024", "custom-2001", "String"),
+    ("DurangoScape 2025", "custom-2002", "String"),
+]
+
+# event id -> (event name, contact field flagging registration); registrants of an event
+# are the contacts with "Yes" in its field
+EVENTS = {
+    1: ("GOT 2024", "GOT 2024"),
+    2: ("DurangoScape 2025", "DurangoScape 2025"),
+}
+
+# contact fields copied into each registration's RegistrationFields
+REGISTRATION_FIELDS = ("First name", "Last name", "e-Mail", "Phone", "Address", "City", "State", "Zip")
+
+# $filter names that map to contact properties rather than field values
+FILTER_PROPERTIES = {
+    "member": "MembershipEnabled",
+    "id": "Id",
+    "email": "Email",
+    "firstname": "FirstName",
+    "lastname": "LastName",
+    "status": "Status",
+    "profilelastupdated": "ProfileLastUpdated",
+}
+
+# contact properties that are also exposed as field values
+MIRRORED_FIELDS = (("FirstName", "First name"), ("LastName", "Last name"), ("Email", "e-Mail"))
+
+FILTER_TERM = re.compile(r"^\s*('(?:[^']|'')*'|[\w.]+)\s+(eq|ne|gt|ge|lt|le)\s+('(?:[^']|'')*'|\S+)\s*$", re.I)
+
+
+def make_contact(contact_id, updated_at, rng):
+    first_name = rng.choice(["Ann", "Bob", "Carla", "Dmitri", "Elena", "Frank", "Grace", "Hiro"])
+    last_name = rng.choice(["Smith", "Garcia", "Nguyen", "Olsen", "Patel", "Reyes", "Walker"])
+    email = "%s.%s%d@example.org" % (first_name.lower(), last_name.lower(), contact_id)
+    values = {
+        "First name": first_name,
+        "Last name": last_name,
+        "e-Mail": email,
+        "Organization": None,
+        "Phone": "970-555-%04d" % (contact_id % 10000),
+        "Address": "%d Main St" % (contact_id % 900 + 100),
+        "City": "Durango",
+        "State": "CO",
+        "Zip": "81301",
+        "Archived": False,
+        "Profile last updated": updated_at,
+        "GOT 2024": rng.choice([None, "Yes"]),
+        "DurangoScape 2025": rng.choice([None, "Yes"]),
+    }
+    contact = new_contact(contact_id, updated_at)
+    contact["MembershipEnabled"] = contact_id % 3 == 0
+    set_field_values(contact, [{"FieldName": name, "Value": value} for name, value in values.items()])
+    return contact
+
+
+def new_contact(contact_id, updated_at, data=None):
+    """contact record from the fixed properties and FieldValues of a POST/PUT body"""
+    contact = {"Id": contact_id, "Url": None, "FirstName": None, "LastName": None, "Email": None,
+               "DisplayName": None, "Organization": None, "Status": "Active", "MembershipEnabled": False,
+               "ProfileLastUpdated": updated_at, "FieldValues": []}
+    update_contact(contact, data or {})
+    return contact
+
+
+def update_contact(contact, data):
+    for prop in ("FirstName", "LastName", "Email", "Organization"):
+        if prop in data:
+            contact[prop] = data[prop]
+    # fixed properties win over their mirrored fields, as in the real api
+    mirrored = [{"FieldName": name, "Value": data[prop]} for prop, name in MIRRORED_FIELDS if prop in data]
+    set_field_values(contact, (data.get("FieldValues") or []) + mirrored)
+    contact["DisplayName"] = "%s, %s" % (contact["LastName"], contact["FirstName"])
+
+
+def set_field_values(contact, field_values):
+    """merge FieldValues by FieldName (or SystemCode) and mirror the fixed properties"""
+    by_name = {field["FieldName"]: field for field in contact["FieldValues"]}
+    system_codes = {code: name for name, code, _ in CONTACT_FIELDS}
+    for field in field_values:
+        name = field.get("FieldName") or system_codes.get(field.get("SystemCode"))
+        if name is None:
+            continue
+        code = next((c for n, c, _ in CONTACT_FIELDS if n == name), None)
+        if name in by_name:
+            by_name[name]["Value"] = field.get("Value")
+        else:
+            by_name[name] = {"FieldName": name, "SystemCode": code, "Value": field.get("Value")}
+            contact["FieldValues"].append(by_name[name])
+    for prop, name in MIRRORED_FIELDS:
+        if name in by_name:
+            contact[prop] = by_name[name]["Value"]
+
+
+class MockWaApiServer(object):
+    """
+    Threaded local Wild Apricot API stand-in. Start with start() or a with block; base_url,
+    auth_url and configure_client(client) point a WaApiClient at it. stats counts requests,
+    statuses and bytes sent/received for benchmarks.
+    """
+
+    def __init__(self, contact_count=1000, latency=0.0, requests_per_minute=None, error_rate=0.0,
+                 gzip_responses=True, token_lifetime=1800, async_polls=2, host="127.0.0.1", port=0, seed=0):
+        """
+        contact_count -- number of generated contacts
+        latency -- seconds added to every request
+        requests_per_minute -- answer 429 with Retry-After above this rate; None for no limit
+        error_rate -- fraction of api requests answered with a random 500/502/503
+        gzip_responses -- gzip bodies when the client sends Accept-Encoding: gzip
+        token_lifetime -- expires_in of issued access tokens
+        async_polls -- ResultUrl polls answered with State 'Processing' before 'Complete'
+        """
+        self.latency = latency
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.gzip_responses = gzip_responses
+        self.token_lifetime = token_lifetime
+        self.async_polls = async_polls
+        self.host = host
+        self.port = port
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.contacts = collections.OrderedDict()
+        self.tokens = {}
+        self.refresh_tokens = set()
+        self.async_results = {}
+        self.request_times = collections.deque()
+        self.stats = collections.Counter()
+        self.next_id = 1
+        self._server = None
+
+        start = datetime.datetime(2024, 1, 1)
+        for index in range(contact_count):
+            updated_at = (start + datetime.timedelta(minutes=17 * index)).strftime("%Y-%m-%dT%H:%M:%S")
+            self.add_contact(make_contact(self.next_id, updated_at, self.random))
+
+    @property
+    def base_url(self):
+        return "http://%s:%d" % (self.host, self._server.server_address[1])
+
+    @property
+    def auth_url(self):
+        return self.base_url + "/auth/token"
+
+    def configure_client(self, client):
+        """point a WaApiClient or AsyncWaApiClient at this server"""
+        client.auth_endpoint = self.auth_url
+        client.api_endpoint = self.base_url
+        return client
+
+    def add_contact(self, contact):
+        with self.lock:
+            if contact.get("Id") is None:
+                contact["Id"] = self.next_id
+            self.next_id = max(self.next_id, contact["Id"]) + 1
+            contact["Url"] = "%s/v2.2/accounts/%d/contacts/%d" % (self._url_base(), ACCOUNT_ID, contact["Id"])
+            self.contacts[contact["Id"]] = contact
+        return contact
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _MockHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, name="WaApiMockServer", daemon=True).start()
+        # contacts created before start() have no host in their Url yet
+        for contact in self.contacts.values():
+            contact["Url"] = "%s/v2.2/accounts/%d/contacts/%d" % (self.base_url, ACCOUNT_ID, contact["Id"])
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats.clear()
+
+    def _url_base(self):
+        return self.base_url if self._server is not None else ""
+
+    def check_rate_limit(self):
+        """return seconds to wait if this request exceeds requests_per_minute, else None"""
+        if not self.requests_per_minute:
+            return None
+        with self.lock:
+            now = time.monotonic()
+            while self.request_times and self.request_times[0] <= now - 60:
+                self.request_times.popleft()
+            if len(self.request_times) >= self.requests_per_minute:
+                return self.request_times[0] + 60 - now
+            self.request_times.append(now)
+        return None
+
+    def query_contacts(self, query):
+        with self.lock:
+            contacts = list(self.contacts.values())
+        condition = query.get("$filter")
+        if condition:
+            terms = [parse_filter_term(term) for term in re.split(r"\s+and\s+", condition, flags=re.I)]
+            contacts = [c for c in contacts if all(matches(c, *term) for term in terms)]
+        return contacts
+
+
+def parse_filter_term(term):
+    match = FILTER_TERM.match(term)
+    if match is None:
+        raise ValueError("Unsupported $filter term: " + term)
+    name, operator, value = match.groups()
+    if name.startswith("'"):
+        name = name[1:-1].replace("''", "'")
+    if value.startswith("'"):
+        value = value[1:-1].replace("''", "'")
+    elif value.lower() in ("true", "false"):
+        value = value.lower() == "true"
+    elif re.match(r"^-?\d+(\.\d+)?$", value):
+        value = float(value)
+    return name, operator.lower(), value
+
+
+def matches(contact, name, operator, value):
+    prop = FILTER_PROPERTIES.get(name.replace(" ", "").lower())
+    if prop is not None:
+        actual = contact.get(prop)
+    else:
+        actual = next((f["Value"] for f in contact["FieldValues"] if f["FieldName"].lower() == name.lower()), None)
+    if isinstance(value, float) and actual is not None:
+        actual = float(actual)
+    if operator == "eq":
+        return actual == value
+    if operator == "ne":
+        return actual != value
+    if actual is None:
+        return False
+    return {"gt": actual > value, "ge": actual >= value, "lt": actual < value, "le": actual <= value}[operator]
+
+
+def make_registration(event_id, contact):
+    event_name, _ = EVENTS[event_id]
+    values = {field["FieldName"]: field for field in contact["FieldValues"]}
+    return {
+        "Id": event_id * 1000000 + contact["Id"],
+        "Event": {"Id": event_id, "Name": event_name},
+        "Contact": {"Id": contact["Id"], "Name": contact["DisplayName"]},
+        "RegistrationTypeId": event_id,
+        "DisplayName": contact["DisplayName"],
+        "Organization": contact["Organization"],
+        "IsCheckedIn": False,
+        "IsPaid": True,
+        "RegistrationFee": 0,
+        "RegistrationDate": contact["ProfileLastUpdated"],
+        "RegistrationFields": [dict(values[name]) for name in REGISTRATION_FIELDS if name in values],
+    }
+
+
+def select_fields(contact, select):
+    if not select:
+        return contact
+    names = {name.strip().strip("'").lower() for name in select.split(",")}
+    result = dict(contact)
+    result["FieldValues"] = [f for f in contact["FieldValues"] if f["FieldName"].lower() in names]
+    return result
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    contacts_path = re.compile(r"^/v2(?:\.\d+)?/accounts/(\d+)/contacts(?:/(\d+))?/?$", re.I)
+    account_path = re.compile(r"^/v2(?:\.\d+)?/accounts/(\d+)/?$", re.I)
+    fields_path = re.compile(r"^/v2(?:\.\d+)?/accounts/(\d+)/contactfields/?$", re.I)
+    registrations_path = re.compile(r"^/v2(?:\.\d+)?/accounts/(\d+)/eventregistrations/?$", re.I)
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        mock = self.mock
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with mock.lock:
+            mock.stats["requests"] += 1
+            mock.stats["bytes_received"] += len(body)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        try:
+            if parts.path.rstrip("/") == "/auth/token":
+                return self._token(method, body)
+            if not self._authorized():
+                return self._send(401, {"error": "invalid_token"})
+            wait = mock.check_rate_limit()
+            if wait is not None:
+                return self._send(429, {"message": "Rate limit exceeded"}, {"Retry-After": str(math.ceil(wait))})
+            if mock.error_rate and mock.random.random() < mock.error_rate:
+                return self._send(mock.random.choice([500, 502, 503]), {"message": "Injected error"})
+            self._route(method, parts.path, query, body)
+        except ValueError as e:
+            self._send(400, {"message": str(e)})
+
+    def _route(self, method, path, query, body):
+        mock = self.mock
+        if re.match(r"^/v2(?:\.\d+)?/accounts/?$", path, re.I) and method == "GET":
+            return self._send(200, [self._account()])
+        match = self.account_path.match(path)
+        if match and method == "GET":
+            return self._send(200, self._account())
+        if self.fields_path.match(path) and method == "GET":
+            fields = [{"Id": index + 1, "FieldName": name, "SystemCode": code, "Type": field_type,
+                       "IsSystem": not code.startswith("custom-")}
+                      for index, (name, code, field_type) in enumerate(CONTACT_FIELDS)]
+            return self._send(200, fields)
+        if self.registrations_path.match(path) and method == "GET":
+            event_id = int(query.get("eventId", 0))
+            if event_id not in EVENTS:
+                return self._send(400, {"message": "Unknown eventId"})
+            with mock.lock:
+                contacts = list(mock.contacts.values())
+            flag_field = EVENTS[event_id][1]
+            return self._send(200, [make_registration(event_id, contact) for contact in contacts
+                                    if any(f["FieldName"] == flag_field and f["Value"] == "Yes"
+                                           for f in contact["FieldValues"])])
+        match = self.contacts_path.match(path)
+        if match is None:
+            return self._send(404, {"message": "Not found: " + path})
+
+        contact_id = int(match.group(2)) if match.group(2) else None
+        if method == "GET" and contact_id is not None:
+            contact = mock.contacts.get(contact_id)
+            return self._send(200, contact) if contact else self._send(404, {"message": "Contact not found"})
+        if method == "GET":
+            return self._contacts_query(query)
+        if method == "POST" and contact_id is None:
+            updated_at = _now()
+            contact = new_contact(None, updated_at, json.loads(body))
+            set_field_values(contact, [{"FieldName": "Profile last updated", "Value": updated_at}])
+            return self._send(200, mock.add_contact(contact))
+        if method == "PUT" and contact_id is not None:
+            contact = mock.contacts.get(contact_id)
+            if contact is None:
+                return self._send(404, {"message": "Contact not found"})
+            data = json.loads(body)
+            with mock.lock:
+                update_contact(contact, data)
+                contact["ProfileLastUpdated"] = _now()
+                set_field_values(contact, [{"FieldName": "Profile last updated", "Value": contact["ProfileLastUpdated"]}])
+            return self._send(200, contact)
+        return self._send(405, {"message": "Method not allowed"})
+
+    def _contacts_query(self, query):
+        mock = self.mock
+        if "resultId" in query:
+            with mock.lock:
+                result = mock.async_results.get(query["resultId"])
+                if result is None:
+                    return self._send(404, {"message": "Unknown resultId"})
+                result["polls"] += 1
+                complete = result["polls"] > mock.async_polls
+            if not complete:
+                return self._send(200, {"ResultId": query["resultId"], "State": "Processing",
+                                        "Processed": result["polls"] * 100})
+            contacts = result["contacts"]
+            page = self._page(contacts, query)
+            return self._send(200, {"ResultId": query["resultId"], "State": "Complete", "Contacts": page})
+
+        contacts = mock.query_contacts(query)
+        if query.get("$async", "true").lower() == "true":
+            result_id = uuid.uuid4().hex
+            with mock.lock:
+                mock.async_results[result_id] = {"contacts": contacts, "polls": 0}
+            result_url = "%s/v2.2/accounts/%d/contacts?resultId=%s" % (mock.base_url, ACCOUNT_ID, result_id)
+            if query.get("$select"):
+                result_url += "&$select=" + urllib.parse.quote(query["$select"])
+            return self._send(200, {"ResultId": result_id, "ResultUrl": result_url, "Requested": _now(),
+                                    "State": "Waiting"})
+        return self._send(200, {"Contacts": self._page(contacts, query)})
+
+    def _page(self, contacts, query):
+        skip = int(query.get("$skip", 0))
+        top = int(query["$top"]) if "$top" in query else len(contacts)
+        return [select_fields(c, query.get("$select")) for c in contacts[skip:skip + top]]
+
+    def _account(self):
+        base = self.mock.base_url
+        return {"Id": ACCOUNT_ID, "Name": "Mock Botanic Gardens", "PrimaryDomainName": "mock.wildapricot.org",
+                "Url": "%s/v2.2/accounts/%d" % (base, ACCOUNT_ID),
+                "Resources": [{"Name": name, "Url": "%s/v2.2/accounts/%d/%s/" % (base, ACCOUNT_ID, name.lower())}
+                              for name in ("Contacts", "ContactFields", "Events", "EventRegistrations")]}
+
+    def _authorized(self):
+        header = self.headers.get("Authorization") or ""
+        if not header.startswith("Bearer "):
+            return False
+        with self.mock.lock:
+            expires_at = self.mock.tokens.get(header[7:])
+        return expires_at is not None and expires_at > time.time()
+
+    def _token(self, method, body):
+        if method != "POST" or not (self.headers.get("Authorization") or "").startswith("Basic "):
+            return self._send(401, {"error": "invalid_client"})
+        data = dict(urllib.parse.parse_qsl(body.decode()))
+        grant_type = data.get("grant_type")
+        if grant_type == "refresh_token" and data.get("refresh_token") not in self.mock.refresh_tokens:
+            return self._send(400, {"error": "invalid_grant"})
+        if grant_type not in ("client_credentials", "password", "refresh_token"):
+            return self._send(400, {"error": "unsupported_grant_type"})
+        access_token, refresh_token = uuid.uuid4().hex, "rt_" + uuid.uuid4().hex
+        with self.mock.lock:
+            self.mock.tokens[access_token] = time.time() + self.mock.token_lifetime
+            self.mock.refresh_tokens.discard(data.get("refresh_token"))
+            self.mock.refresh_tokens.add(refresh_token)
+            self.mock.stats["token_requests"] += 1
+        self._send(200, {"access_token": access_token, "token_type": "Bearer", "expires_in": self.mock.token_lifetime,
+                         "refresh_token": refresh_token,
+                         "Permissions": [{"AccountId": ACCOUNT_ID, "SecurityProfileId": 1,
+                                          "AvailableScopes": ["contacts_view", "contacts_edit", "account_view"]}]})
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if status == 200 and self.command == "GET" and self.headers.get("If-None-Match") == etag:
+            status, body = 304, b""
+        encoding = None
+        if body and self.mock.gzip_responses and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body, encoding = gzip.compress(body, compresslevel=5), "gzip"
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if status in (200, 304) and self.command == "GET":
+            self.send_header("ETag", etag)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.mock.lock:
+            self.mock.stats["status_%d" % status] += 1
+            self.mock.stats["bytes_sent"] += len(body)
+
+
+def _now():
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run a local Wild Apricot API stand-in server')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--contacts', type=int, default=1000, help='Generated contacts (default: 1000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--requests-per-minute', type=int, default=None, help='Answer 429 above this rate')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 5xx')
+    parser.add_argument('--no-gzip', action='store_true', help='Never gzip responses')
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    server = MockWaApiServer(contact_count=args.contacts, latency=args.latency,
+                             requests_per_minute=args.requests_per_minute, error_rate=args.error_rate,
+                             gzip_responses=not args.no_gzip, port=args.port).start()
+    print("Wild Apricot API stand-in listening on %s (token endpoint %s)" % (server.base_url, server.auth_url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
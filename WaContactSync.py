@@ -0,0 +1,288 @@
+# Title: WaContactSync
+# Purpose: Keep a local SQLite mirror of Wild Apricot contacts and field values, fetching only
+#          contacts whose profile changed since the last sync
+# Dependencies: argparse, datetime, json, logging, os, sqlite3, sys, WaApi
+# Usage: python WaContactSync.py contacts_mirror.db --api-key YOUR_API_KEY
+#        python WaContactSync.py contacts_mirror.db --full
+#        python WaContactSync.py --accounts accounts.json
+# Date/Name/Change
+# 10/18/2026 - Initial version: full load through the async query API, then delta sync on 'Profile last updated'
+# 10/18/2026 - Added --metrics-file to dump API latency/bytes/retry metrics (JSON, or Prometheus text for .prom)
+# 10/18/2026 - Added --record/--replay to capture API traffic to a cassette and rerun a sync offline from it
+# 10/18/2026 - Added --accounts: sync several accounts concurrently, each with its own token, rate limit and mirror
+
+from datetime import datetime
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+import WaApi
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    id INTEGER PRIMARY KEY,
+    first_name TEXT,
+    last_name TEXT,
+    email TEXT,
+    display_name TEXT,
+    organization TEXT,
+    status TEXT,
+    profile_last_updated TEXT,
+    raw_json TEXT,
+    synced_at TEXT
+);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email);
+CREATE TABLE IF NOT EXISTS field_values (
+    contact_id INTEGER NOT NULL,
+    field_name TEXT NOT NULL,
+    system_code TEXT,
+    value TEXT,
+    PRIMARY KEY (contact_id, field_name)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Wild Apricot field holding the last profile change; the sync watermark is compared against it
+LAST_UPDATED_FIELD = 'Profile last updated'
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    return logging.getLogger(__name__)
+
+def open_mirror(db_path):
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+def get_watermark(connection):
+    row = connection.execute("SELECT value FROM sync_state WHERE key = 'watermark'").fetchone()
+    return row[0] if row else None
+
+def field_value_to_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value, cls=WaApi._ApiObjectEncoder)
+
+def contact_rows(contact, synced_at):
+    state = json.loads(json.dumps(contact, cls=WaApi._ApiObjectEncoder))
+    field_rows = []
+    last_updated = state.get('ProfileLastUpdated')
+    for field in state.get('FieldValues') or []:
+        if field.get('FieldName') == LAST_UPDATED_FIELD and field.get('Value'):
+            last_updated = field['Value']
+        field_rows.append((state['Id'], field.get('FieldName'), field.get('SystemCode'),
+                           field_value_to_text(field.get('Value'))))
+    contact_row = (state['Id'], state.get('FirstName'), state.get('LastName'), state.get('Email'),
+                   state.get('DisplayName'), state.get('Organization'), state.get('Status'),
+                   last_updated, json.dumps(state), synced_at)
+    return contact_row, field_rows
+
+def upsert_contacts(connection, contacts, synced_at):
+    """Upsert a batch of contacts and their field values; returns the newest profile update seen"""
+    newest = None
+    contact_batch = []
+    field_batch = []
+    for contact in contacts:
+        contact_row, field_rows = contact_rows(contact, synced_at)
+        contact_batch.append(contact_row)
+        field_batch.extend(field_rows)
+        if contact_row[7] and (newest is None or contact_row[7] > newest):
+            newest = contact_row[7]
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO contacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", contact_batch)
+        connection.executemany(
+            "DELETE FROM field_values WHERE contact_id = ?", [(row[0],) for row in contact_batch])
+        connection.executemany("INSERT INTO field_values VALUES (?, ?, ?, ?)", field_batch)
+    return newest
+
+def sync_contacts(api, connection, logger, full=False, page_size=500, batch_size=500):
+    """
+    Fetch contacts into the mirror. Without a watermark (or with full=True) every contact is
+    loaded through the async query API and contacts no longer in the account are removed from
+    the mirror; otherwise only contacts with 'Profile last updated' at or after the watermark
+    are fetched. The watermark is the newest profile update stored,
+    so it follows the server clock rather than the local one.
+    """
+    watermark = None if full else get_watermark(connection)
+    synced_at = datetime.now().isoformat(timespec='seconds')
+    if watermark is None:
+        logger.info("No sync watermark - loading all contacts")
+        contacts = api.iter_contacts_async(page_size=page_size)
+    else:
+        logger.info(f"Fetching contacts updated since {watermark}")
+        contacts = api.iter_contacts(filter=f"'{LAST_UPDATED_FIELD}' ge {watermark}", page_size=page_size)
+
+    synced_count = 0
+    newest = watermark
+    seen_ids = set()
+    batch = []
+    for contact in contacts:
+        if watermark is None:
+            seen_ids.add(contact.Id)
+        batch.append(contact)
+        if len(batch) >= batch_size:
+            batch_newest = upsert_contacts(connection, batch, synced_at)
+            newest = max(filter(None, [newest, batch_newest]), default=None)
+            synced_count += len(batch)
+            logger.info(f"   {synced_count} contacts applied")
+            batch = []
+    if batch:
+        batch_newest = upsert_contacts(connection, batch, synced_at)
+        newest = max(filter(None, [newest, batch_newest]), default=None)
+        synced_count += len(batch)
+
+    deleted_count = 0
+    with connection:
+        if watermark is None:
+            # full load: contacts the account no longer returns were deleted there
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS seen_ids (id INTEGER PRIMARY KEY)")
+            connection.execute("DELETE FROM seen_ids")
+            connection.executemany("INSERT INTO seen_ids VALUES (?)", [(contact_id,) for contact_id in seen_ids])
+            connection.execute("DELETE FROM field_values WHERE contact_id NOT IN (SELECT id FROM seen_ids)")
+            deleted_count = connection.execute(
+                "DELETE FROM contacts WHERE id NOT IN (SELECT id FROM seen_ids)").rowcount
+            connection.execute("DROP TABLE seen_ids")
+        if newest is not None:
+            connection.execute("INSERT OR REPLACE INTO sync_state VALUES ('watermark', ?)", (newest,))
+        connection.execute("INSERT OR REPLACE INTO sync_state VALUES ('last_sync', ?)", (synced_at,))
+
+    total = connection.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+    logger.info(f"Sync summary:")
+    logger.info(f"   - {synced_count} contacts fetched and upserted")
+    logger.info(f"   - {deleted_count} contacts removed (no longer in the account)")
+    logger.info(f"   - {total} contacts in mirror")
+    logger.info(f"   - New watermark: {newest}")
+    return {'synced_count': synced_count, 'deleted_count': deleted_count, 'total_count': total,
+            'watermark': newest}
+
+class AccountLogger(logging.LoggerAdapter):
+    """Prefix log lines with the account name, so concurrent account syncs can be told apart"""
+    def process(self, msg, kwargs):
+        return f"[{self.extra['account']}] {msg}", kwargs
+
+def load_accounts(accounts_path):
+    """
+    Accounts file: a JSON list of {"name", "database", "api_key_env", "requests_per_minute"};
+    api_key_env defaults to WA_API_KEY_<NAME> and requests_per_minute to 60. Keys are read
+    from the environment so the file holds no secrets.
+    """
+    with open(accounts_path, 'r') as accounts_file:
+        accounts = json.load(accounts_file)
+    for account in accounts:
+        account.setdefault('api_key_env', f"WA_API_KEY_{account['name'].upper()}")
+        account.setdefault('requests_per_minute', 60)
+    return accounts
+
+def sync_accounts(accounts, logger, full=False, page_size=500, token_manager=None, metrics=None):
+    """Sync every account into its own mirror concurrently; returns the registry result table"""
+    registry = WaApi.AccountRegistry()
+    databases = {}
+    missing = []
+    for account in accounts:
+        api_key = os.environ.get(account['api_key_env'])
+        if not api_key:
+            missing.append({'Account': account['name'], 'Status': 'failed', 'Result': None,
+                            'Error': f"{account['api_key_env']} is not set", 'Seconds': 0.0})
+            continue
+        registry.add_account(account['name'], api_key=api_key, requests_per_minute=account['requests_per_minute'],
+                             token_manager=token_manager, lazy_objects=True, metrics=metrics)
+        databases[account['name']] = account['database']
+
+    def sync_one(name, api):
+        connection = open_mirror(databases[name])
+        try:
+            return sync_contacts(api, connection, AccountLogger(logger, {'account': name}), full, page_size)
+        finally:
+            connection.close()
+
+    with registry:
+        results = registry.run(sync_one) + missing
+    logger.info("Accounts summary:")
+    for row in results:
+        if row['Status'] == 'ok':
+            logger.info(f"   - {row['Account']}: {row['Result']['synced_count']} contacts synced "
+                        f"in {row['Seconds']:.1f}s")
+        else:
+            logger.error(f"   - {row['Account']}: sync failed: {row['Error']}")
+    return results
+
+def write_metrics(metrics, metrics_path, logger):
+    if metrics_path.endswith('.prom'):
+        metrics.write_prometheus(metrics_path)
+    else:
+        metrics.write_json(metrics_path)
+    logger.info(f"API metrics written to: {metrics_path}")
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Delta sync Wild Apricot contacts into a local SQLite mirror')
+    parser.add_argument('database', nargs='?', help='Path to the SQLite mirror file (created if missing)')
+    parser.add_argument('--accounts', default=None,
+                        help='JSON file listing several accounts (name, database, api_key_env) to sync concurrently')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the watermark, reload every contact and remove contacts deleted in Wild Apricot')
+    parser.add_argument('--page-size', type=int, default=500, help='Contacts per API page (default: 500)')
+    parser.add_argument('--api-key', default=os.environ.get('WA_API_KEY'),
+                        help='Wild Apricot API key (default: WA_API_KEY environment variable)')
+    parser.add_argument('--token-cache', default=None,
+                        help='Optional token cache file so repeated syncs skip the OAuth round trip')
+    parser.add_argument('--metrics-file', default=None,
+                        help='Write API metrics at the end of the sync (.prom for Prometheus text, otherwise JSON)')
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument('--record', default=None, metavar='CASSETTE',
+                                help='Record API requests and responses (secrets redacted) to this file')
+    cassette_group.add_argument('--replay', default=None, metavar='CASSETTE',
+                                help='Answer API requests from a recorded cassette instead of the network')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    logger = setup_logging()
+    token_manager = WaApi.TokenManager(args.token_cache) if args.token_cache else None
+    metrics = WaApi.ApiMetrics() if args.metrics_file else None
+
+    if args.accounts:
+        if args.database or args.record or args.replay:
+            logger.error("--accounts takes the mirror paths from the accounts file and cannot record or replay")
+            sys.exit(1)
+        results = sync_accounts(load_accounts(args.accounts), logger, args.full, args.page_size,
+                                token_manager, metrics)
+        if metrics is not None:
+            write_metrics(metrics, args.metrics_file, logger)
+        sys.exit(0 if results and all(row['Status'] == 'ok' for row in results) else 1)
+
+    if not args.database:
+        logger.error("A mirror database path (or --accounts) is required")
+        sys.exit(1)
+    if not args.api_key and not args.replay:
+        logger.error("An API key is required (--api-key or WA_API_KEY)")
+        sys.exit(1)
+
+    pool = None
+    if args.record:
+        pool = WaApi.RecordingTransport(args.record)
+    elif args.replay:
+        pool = WaApi.ReplayTransport(args.replay)
+    api = WaApi.WaApiClient(None, None, pool=pool, token_manager=token_manager, lazy_objects=True, metrics=metrics)
+    connection = open_mirror(args.database)
+    try:
+        api.authenticate_with_apikey(args.api_key or 'REPLAY')
+        sync_contacts(api, connection, logger, args.full, args.page_size)
+    except Exception as e:
+        logger.error(f"Contact sync failed: {e}")
+        sys.exit(1)
+    finally:
+        connection.close()
+        api.close()
+        if metrics is not None:
+            write_metrics(metrics, args.metrics_file, logger)
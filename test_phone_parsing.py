@@ -0,0 +1,37 @@
+# Title: test_phone_parsing
+# Purpose: Table of phone formats parse_phone_numbers in Generic_WildApricot_Data_Import_Cleanse.py must handle
+# Dependencies: pandas, pytest
+# Usage: python -m pytest test_phone_parsing.py
+# Date/Name/Change
+# 10/18/2026 - Initial version: +1/dots, extension markers in any case, trailing labels, keypad letters
+
+import pandas as pd
+import pytest
+
+from Generic_WildApricot_Data_Import_Cleanse import parse_phone_numbers
+
+# raw value, PhoneNumber, PhoneExtension, PhoneLabel, IsValidPhone
+PHONE_CASES = [
+    ('970-555-1212', '970-555-1212', '', '', True),
+    ('+1 970.555.1212', '970-555-1212', '', '', True),
+    ('1-970-555-1212', '970-555-1212', '', '', True),
+    ('970-555-1212 x23', '970-555-1212', '23', '', True),
+    ('970-555-1212 X23', '970-555-1212', '23', '', True),
+    ('970-555-1212 Ext. 23', '970-555-1212', '23', '', True),
+    ('970-555-1212 extension 23', '970-555-1212', '23', '', True),
+    ('(970)555-1212 cell', '970-555-1212', '', 'cell', True),
+    ('970 555 1212 (Home)', '970-555-1212', '', 'Home', True),
+    ('970-555-PLNT', '970-555-7568', '', '', True),
+    ('911-555-1212', '911-555-1212', '', '', False),
+    ('555-1212', '', '', '', False),
+    ('', '', '', '', False),
+]
+
+
+@pytest.mark.parametrize('raw, number, extension, label, valid', PHONE_CASES)
+def test_parse_phone_numbers(raw, number, extension, label, valid):
+    parsed = parse_phone_numbers(pd.Series([raw])).iloc[0]
+    assert parsed['PhoneNumber'] == number
+    assert parsed['PhoneExtension'] == extension
+    assert parsed['PhoneLabel'] == label
+    assert bool(parsed['IsValidPhone']) == valid